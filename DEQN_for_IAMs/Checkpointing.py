@@ -0,0 +1,131 @@
+# Background checkpointing of the training state
+
+import atexit
+import signal
+import threading
+import time
+import tensorflow as tf
+import Parameters
+
+"""
+Overview:
+    - save() snapshots the checkpointed variables and returns, the snapshot is written to disk in the background
+    - a save that is requested while the previous snapshot is still being written is coalesced: it is skipped and the
+      newest state is written with the next save once the writer is free (or at exit)
+    - the last state is flushed at exit and on SIGTERM, so STARTING_POINT: LATEST always finds a complete checkpoint
+    - the snapshot is taken and written by the native asynchronous checkpointing of TF >= 2.9, with older versions (the
+      pinned 2.3 included) or ASYNC_CHECKPOINT: False every save is synchronous
+"""
+
+def async_options():
+    """ CheckpointOptions for asynchronous writes, None if this TF version does not support them """
+    if not hasattr(tf.train, 'CheckpointOptions'):
+        return None
+    try:
+        return tf.train.CheckpointOptions(experimental_enable_async_checkpoint=True)
+    except TypeError:
+        return None
+
+class CheckpointService:
+    def __init__(self, checkpoint, manager, asynchronous=True):
+        self.checkpoint = checkpoint
+        self.manager = manager
+        self.options = async_options() if asynchronous else None
+        # completion of a write can only be awaited if the checkpoint can be synced
+        self.trackable = self.options is not None and hasattr(checkpoint, 'sync')
+        self.writer_thread = None
+        self.pending = False
+        self.closed = False
+        self.last_blocking_seconds = 0.0
+        self.last_write_seconds = 0.0
+        self.n_saves = 0
+        self.n_coalesced = 0
+        self.total_blocking_seconds = 0.0
+        self.total_write_seconds = 0.0
+
+        if self.options is None and asynchronous:
+            print("Asynchronous checkpointing needs TensorFlow 2.9 or later, saving synchronously.")
+
+    def writing(self):
+        return self.writer_thread is not None and self.writer_thread.is_alive()
+
+    def wait_for_write(self, start):
+        self.checkpoint.sync()
+        self.last_write_seconds = time.perf_counter() - start
+        self.total_write_seconds += self.last_write_seconds
+
+    def save(self, force=False):
+        """ Snapshots the current state and writes it in the background, with force also within the CHECKPOINT_INTERVAL """
+        if self.closed:
+            return None
+
+        if self.writing():
+            self.pending = True
+            self.n_coalesced += 1
+            return None
+
+        start = time.perf_counter()
+        if self.options is not None:
+            path = self.manager.save(check_interval=not force, options=self.options)
+        else:
+            path = self.manager.save(check_interval=not force)
+        self.last_blocking_seconds = time.perf_counter() - start
+        self.total_blocking_seconds += self.last_blocking_seconds
+        self.pending = False
+
+        if path is None:
+            # within the CHECKPOINT_INTERVAL nothing was written
+            return None
+
+        self.n_saves += 1
+        if self.trackable:
+            self.writer_thread = threading.Thread(target=self.wait_for_write, args=(start,), daemon=True)
+            self.writer_thread.start()
+        else:
+            self.last_write_seconds = self.last_blocking_seconds
+            self.total_write_seconds += self.last_write_seconds
+
+        tf.print("Checkpoint " + path + " (training blocked for {:.3f}s, last write took {:.3f}s)".format(self.last_blocking_seconds, self.last_write_seconds))
+        return path
+
+    def flush(self):
+        """ Writes the pending state and waits until every write is on disk """
+        if self.closed:
+            return
+        if self.writing():
+            self.writer_thread.join()
+        if self.pending:
+            self.pending = False
+            start = time.perf_counter()
+            if self.options is not None:
+                self.manager.save(options=self.options, check_interval=False)
+            else:
+                self.manager.save(check_interval=False)
+            self.total_blocking_seconds += time.perf_counter() - start
+            self.n_saves += 1
+        if self.options is not None and hasattr(self.checkpoint, 'sync'):
+            self.checkpoint.sync()
+        self.closed = True
+
+        if self.n_saves > 0:
+            print("Checkpointing: {} saves, {} coalesced, training blocked for {:.3f}s and writes took {:.3f}s on average, the last write took {:.3f}s".format(
+                self.n_saves, self.n_coalesced, self.total_blocking_seconds / self.n_saves, self.total_write_seconds / self.n_saves, self.last_write_seconds))
+
+def handle_sigterm(signum, frame):
+    service.flush()
+    # the default SIGTERM exit code
+    raise SystemExit(128 + signum)
+
+service = CheckpointService(Parameters.ckpt, Parameters.manager, Parameters.async_checkpoint)
+
+# only the first worker writes checkpoints
+if not Parameters.horovod_worker:
+    atexit.register(service.flush)
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, handle_sigterm)
+
+def save(force=False):
+    return service.save(force)
+
+def flush():
+    service.flush()
@@ -0,0 +1,113 @@
+# Compilation of the hot paths into graphs, optionally JIT compiled with XLA
+
+import inspect
+import json
+import time
+import tensorflow as tf
+from Parameters import strict_tracing, trace_budget, xla_compile
+
+"""
+Overview:
+    - function(fn) wraps fn into a tf.function, which is JIT compiled with XLA if xla_compile is set in the run config
+    - function(fn, jit=False) never compiles fn with XLA, but still retraces it (with its nested functions) after a fallback
+    - if XLA can not compile a graph (e.g. an op is unsupported), every function falls back to an uncompiled tf.function
+    - every trace of a function is counted and logged with the signature of the call that caused it (shapes and dtypes of
+      the tensors, values of the python arguments) and the time it took to build the graph
+    - a function traced more than trace_budget times prints a warning, or fails the run with strict_tracing
+"""
+
+xla_enabled = xla_compile
+compiled_functions = []
+
+# the keyword was renamed in TF 2.5
+JIT_KEYWORD = 'jit_compile' if 'jit_compile' in inspect.signature(tf.function).parameters else 'experimental_compile'
+
+def describe(value):
+    """ Short description of an argument as it matters for tracing """
+    if hasattr(value, "shape") and hasattr(value, "dtype"):
+        return tf.as_dtype(value.dtype).name + str(tf.TensorShape(value.shape).as_list())
+    if isinstance(value, (list, tuple)):
+        return type(value)([describe(v) for v in value])
+    return repr(value)
+
+class CompiledFunction:
+    def __init__(self, python_function, jit, name=None):
+        self.python_function = python_function
+        self.jit = jit
+        self.name = name or python_function.__name__
+        # every trace: signature, seconds to build the graph and whether it was built with XLA
+        self.traces = []
+        self.build()
+        compiled_functions.append(self)
+
+    def traced_function(self):
+        """ python_function, counting and timing every time tf.function traces it """
+        def traced(*args, **kwargs):
+            signature = ", ".join([describe(a) for a in args] + [k + "=" + describe(v) for k, v in kwargs.items()])
+            self.build_traces += 1
+            if trace_budget is not None and self.build_traces > trace_budget:
+                message = self.name + " traced " + str(self.build_traces) + " times (budget " + str(trace_budget) + "), last signature: (" + signature + ")"
+                if strict_tracing:
+                    raise RuntimeError("Retracing budget exceeded: " + message)
+                print("WARNING: " + message)
+            start = time.perf_counter()
+            result = self.python_function(*args, **kwargs)
+            seconds = time.perf_counter() - start
+            self.traces.append({"signature": signature, "seconds": seconds, "xla": self.jit and xla_enabled})
+            print("Traced " + self.name + " (" + signature + ") in " + "{:.2f}".format(seconds) + "s" + (", retrace " + str(self.build_traces - 1) if self.build_traces > 1 else ""))
+            return result
+        # tf.function reads the argument names from the signature
+        traced.__signature__ = inspect.signature(self.python_function)
+        traced.__name__ = self.name
+        return traced
+
+    def build(self):
+        self.build_traces = 0
+        if self.jit and xla_enabled:
+            self.tf_function = tf.function(self.traced_function(), **{JIT_KEYWORD: True})
+        else:
+            self.tf_function = tf.function(self.traced_function())
+
+    def __call__(self, *args, **kwargs):
+        if not xla_enabled:
+            return self.tf_function(*args, **kwargs)
+
+        try:
+            return self.tf_function(*args, **kwargs)
+        except (tf.errors.InvalidArgumentError, tf.errors.UnimplementedError) as e:
+            if not xla_enabled or not ("XLA" in e.message or "compil" in e.message):
+                raise
+            print("WARNING: XLA compilation of " + self.python_function.__name__ + " failed, falling back to uncompiled graphs:")
+            print(e.message.split("\n")[0])
+            disable_xla()
+            return self.tf_function(*args, **kwargs)
+
+def disable_xla():
+    global xla_enabled
+    xla_enabled = False
+    for compiled_function in compiled_functions:
+        compiled_function.build()
+
+def function(python_function=None, jit=True, name=None):
+    """ Usable as @function, @function(jit=False) or function(fn, name="...") """
+    if python_function is None:
+        return lambda f: CompiledFunction(f, jit, name)
+    return CompiledFunction(python_function, jit, name)
+
+def trace_report():
+    """ Number of traces and total tracing time of every function """
+    return {f.name: {"traces": len(f.traces), "seconds": sum(t["seconds"] for t in f.traces), "signatures": [t["signature"] for t in f.traces]} for f in compiled_functions}
+
+def print_trace_report():
+    for name, report in trace_report().items():
+        print("{:<32} {:>4} traces {:>8.2f}s".format(name, report["traces"], report["seconds"]))
+
+def write_trace_report(filename):
+    with open(filename, 'w') as f:
+        json.dump(trace_report(), f, indent=2)
+
+def op_count(compiled_function, *args):
+    """ Number of ops in the graph of compiled_function for the given arguments (tensors or tf.TensorSpecs), the functions
+    it calls (loops, conditions, nested tf.functions) included """
+    graph_def = compiled_function.tf_function.get_concrete_function(*args).graph.as_graph_def()
+    return len(graph_def.node) + sum(len(f.node_def) for f in graph_def.library.function)
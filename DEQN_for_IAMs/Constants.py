@@ -0,0 +1,68 @@
+# Parameter store: the constants of the model as non-trainable tf.Variables
+
+import os
+import numpy as np
+import tensorflow as tf
+from omegaconf import OmegaConf
+
+"""
+Overview:
+    - every numeric constant of the constants config becomes a non-trainable float32 tf.Variable, which is attached to the
+      Parameters module under its name, so the model Definitions and Equations read it as before (e.g. Parameters.psi)
+    - the traced graphs (run_grads, the simulator, ...) capture the variables and not their values, so a new calibration
+      can be assigned in place (assign / load) and is used by the next call without retracing
+    - constants of an ensemble that differ between the members are [K, 1] variables (see Ensemble.py)
+    - constants that are not numbers (strings, lists, ...) stay python values and can not be changed
+"""
+
+def is_numeric(value):
+    return isinstance(value, (int, float, np.number, np.ndarray, tf.Tensor)) and not isinstance(value, bool)
+
+class ParameterStore:
+    def __init__(self, constants, dtype=tf.float32):
+        self.dtype = dtype
+        self.variables = {}
+        self.fixed = {}
+        for key, value in constants.items():
+            if is_numeric(value):
+                self.variables[key] = tf.Variable(tf.cast(value, dtype), trainable=False, name=key)
+            else:
+                self.fixed[key] = value
+
+    def __contains__(self, key):
+        return key in self.variables or key in self.fixed
+
+    def __getitem__(self, key):
+        return self.variables[key] if key in self.variables else self.fixed[key]
+
+    def items(self):
+        return list(self.variables.items()) + list(self.fixed.items())
+
+    def value(self, key):
+        """ Current value of a constant as a python number (numpy array for ensemble constants) """
+        if key in self.fixed:
+            return self.fixed[key]
+        value = self.variables[key].numpy()
+        return value.item() if value.ndim == 0 else value
+
+    def values(self):
+        return {key: self.value(key) for key, _ in self.items()}
+
+    def assign(self, values):
+        """ Assigns new values to the constants, the shapes of the variables can not change """
+        unknown = [key for key in values.keys() if key not in self.variables]
+        if unknown:
+            raise ValueError("Can not assign to the constants " + str(unknown) + ", they are not numeric constants of this run.")
+        for key, value in values.items():
+            variable = self.variables[key]
+            value = tf.cast(value, self.dtype)
+            if value.shape != variable.shape:
+                value = tf.broadcast_to(value, variable.shape)
+            variable.assign(value)
+
+    def load(self, name, config_dir=None):
+        """ Assigns the constants of config/constants/<name>.yaml """
+        config_dir = config_dir or os.path.join(os.path.dirname(os.path.abspath(__file__)), "config")
+        constants = OmegaConf.to_container(OmegaConf.load(os.path.join(config_dir, "constants", name + ".yaml")))["constants"]
+        self.assign({key: value for key, value in constants.items() if key in self.variables})
+        print("Constants " + name + " assigned")
@@ -0,0 +1,119 @@
+# Convergence monitor: ends the training once the smoothed loss reaches a tolerance or stops improving
+
+import json
+import time
+import tensorflow as tf
+import Parameters
+
+if Parameters.horovod:
+    import horovod.tensorflow as hvd
+
+"""
+Overview:
+    - after every episode the net loss (without penalties) and the residual of every equation of the last epoch are
+      smoothed with an exponential moving average (convergence_smoothing)
+    - tolerance: converged once the smoothed net MSE is below convergence_tolerance and/or the smoothed MSE of every
+      equation is below convergence_equation_tolerance (whichever are set)
+    - plateau: converged once the smoothed net MSE has not improved by a relative convergence_min_delta
+      for convergence_patience episodes
+    - no criterion is checked before convergence_min_episodes episodes
+    - in data-parallel runs the losses are averaged over the workers first, so all workers stop together
+"""
+
+def global_mean(values):
+    """ Mean of a tensor over all workers """
+    if Parameters.horovod:
+        return hvd.allreduce(values)
+    if Parameters.strategy is not None:
+        mean = Parameters.strategy.run(lambda v: tf.distribute.get_replica_context().all_reduce(tf.distribute.ReduceOp.MEAN, v), args=(values,))
+        return Parameters.strategy.experimental_local_results(mean)[0]
+    return values
+
+class ConvergenceMonitor:
+    def __init__(self, equation_names, n_samples, smoothing=0.9, tolerance=None, equation_tolerance=None, patience=None, min_delta=0.0, min_episodes=0):
+        self.equation_names = equation_names
+        # the losses are sums over the samples of an epoch
+        self.n_samples = n_samples
+        self.smoothing = smoothing
+        self.tolerance = tolerance
+        self.equation_tolerance = equation_tolerance
+        self.patience = patience
+        self.min_delta = min_delta
+        self.min_episodes = min_episodes
+        self.enabled = tolerance is not None or equation_tolerance is not None or patience is not None
+
+        self.episodes = 0
+        self.episode = None
+        self.smoothed_loss = None
+        self.smoothed_equation_losses = None
+        # MSEs of the last epoch, as pulled to the host by update
+        self.last_loss = None
+        self.last_net_loss = None
+        self.best_loss = float('inf')
+        self.episodes_without_improvement = 0
+        self.converged = False
+        self.reason = None
+        self.start_time = time.time()
+
+    def update(self, episode, net_loss, equation_losses, loss=None):
+        """ Adds the losses of the last epoch of an episode, returns True once converged. The loss with penalties is only
+        pulled to the host with the others (in the same transfer) for printing. """
+        values = [tf.reshape(tf.cast(net_loss, tf.float32), [1]), tf.cast(equation_losses, tf.float32)]
+        if loss is not None:
+            values.append(tf.reshape(tf.cast(loss, tf.float32), [1]))
+        values = tf.concat(values, axis=0)
+        if Parameters.num_workers > 1:
+            values = global_mean(values)
+        values = values.numpy() / self.n_samples
+        if loss is not None:
+            self.last_loss, values = float(values[-1]), values[:-1]
+        self.last_net_loss = float(values[0])
+
+        if self.smoothed_loss is None:
+            self.smoothed_loss = float(values[0])
+            self.smoothed_equation_losses = [float(v) for v in values[1:]]
+        else:
+            self.smoothed_loss = self.smoothing * self.smoothed_loss + (1 - self.smoothing) * float(values[0])
+            self.smoothed_equation_losses = [self.smoothing * s + (1 - self.smoothing) * float(v) for s, v in zip(self.smoothed_equation_losses, values[1:])]
+        self.episodes += 1
+        self.episode = episode
+
+        if self.smoothed_loss < self.best_loss * (1 - self.min_delta):
+            self.best_loss = self.smoothed_loss
+            self.episodes_without_improvement = 0
+        else:
+            self.episodes_without_improvement += 1
+
+        if not self.enabled or self.episodes < self.min_episodes:
+            return False
+
+        if self.tolerance is not None or self.equation_tolerance is not None:
+            below_tolerance = self.tolerance is None or self.smoothed_loss <= self.tolerance
+            equations_below_tolerance = self.equation_tolerance is None or max(self.smoothed_equation_losses) <= self.equation_tolerance
+            if below_tolerance and equations_below_tolerance:
+                self.converged, self.reason = True, 'tolerance'
+
+        if not self.converged and self.patience is not None and self.episodes_without_improvement >= self.patience:
+            self.converged, self.reason = True, 'plateau'
+
+        if self.converged:
+            tf.print("Converged after episode " + str(episode) + " (" + self.reason + "), smoothed MSE without penalties: " + str(self.smoothed_loss))
+
+        return self.converged
+
+    def summary(self):
+        return {
+            "converged": self.converged,
+            "reason": self.reason if self.converged else ("disabled" if not self.enabled else "episode budget exhausted"),
+            "last_episode": self.episode,
+            "episodes_run": self.episodes,
+            "elapsed_seconds": time.time() - self.start_time,
+            "smoothed_MSE_no_penalty": self.smoothed_loss,
+            "best_smoothed_MSE_no_penalty": self.best_loss if self.episodes > 0 else None,
+            "episodes_without_improvement": self.episodes_without_improvement,
+            "smoothed_equation_MSE": dict(zip(self.equation_names, self.smoothed_equation_losses or [])),
+        }
+
+    def write_summary(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
@@ -3,16 +3,62 @@ import numpy as np
 import tensorflow as tf
 from Parameters import definitions, definition_bounds_hard, MODEL_NAME
 import sys
+import threading
 
 Model_Definitions = importlib.import_module(MODEL_NAME + ".Definitions")
 
+# the cache of the current evaluation, per thread, so concurrent evaluations (e.g. a tf.function traced on another thread) do not share it
+evaluation = threading.local()
+
+class EvaluationContext:
+    """ Caches every definition result for the duration of one evaluation (e.g. one loss or one post-processing call).
+    
+    Results are keyed by the definition name and the identity of the (state, policy_state) pair, so definitions calling each other,
+    the equations and the expectation integrands all share a single evaluation. Works in eager mode as well as while tracing a tf.function.
+    Nested contexts share the cache of the outermost one, every thread has a cache of its own.
+    """
+    def __enter__(self):
+        self.outermost = getattr(evaluation, 'cache', None) is None
+        if self.outermost:
+            evaluation.cache = {}
+        return self
+    
+    def __exit__(self, *exc):
+        if self.outermost:
+            evaluation.cache = None
+        return False
+
+def evaluation_context():
+    return EvaluationContext()
+
+def memoized(de, definition):
+    def memoized_definition(s, ps):
+        cache = getattr(evaluation, 'cache', None)
+        if cache is None:
+            return definition(s, ps)
+        key = (de, id(s), id(ps))
+        if key not in cache:
+            # the inputs are kept alive together with the result, so their ids cannot be reused inside the context
+            cache[key] = (s, ps, definition(s, ps))
+        return cache[key][2]
+    return memoized_definition
+
+# the model definitions call each other through their module globals, so the memoized versions are installed there
+for d in definitions:
+    setattr(Model_Definitions, d, memoized(d, getattr(Model_Definitions, d)))
+
 for d in definitions:
     if (d in definition_bounds_hard['lower']) or (d in definition_bounds_hard['upper']):
         setattr(sys.modules[__name__],d, 
                 (lambda de: lambda s, ps: tf.clip_by_value(getattr(Model_Definitions,de)(s, ps), definition_bounds_hard['lower'].get(de, np.NINF), definition_bounds_hard['upper'].get(de,np.Inf)))(d)
                 )
+        # bounded and raw value from a single evaluation - this is used for penalties
+        setattr(sys.modules[__name__],d + "_AND_RAW", 
+                (lambda de: lambda s, ps: (lambda raw: (tf.clip_by_value(raw, definition_bounds_hard['lower'].get(de, np.NINF), definition_bounds_hard['upper'].get(de,np.Inf)), raw))(getattr(Model_Definitions,de)(s, ps)))(d)
+                )
     else:
         setattr(sys.modules[__name__],d, (lambda de: lambda s, ps: getattr(Model_Definitions,de)(s, ps))(d))
+        setattr(sys.modules[__name__],d + "_AND_RAW", (lambda de: lambda s, ps: (lambda raw: (raw, raw))(getattr(Model_Definitions,de)(s, ps)))(d))
         
     # always add a 'raw' attribute as well - this can be used for penalties
-    setattr(sys.modules[__name__],d + "_RAW", (lambda de: lambda s, ps: getattr(Model_Definitions,de)(s, ps))(d))
\ No newline at end of file
+    setattr(sys.modules[__name__],d + "_RAW", (lambda de: lambda s, ps: getattr(Model_Definitions,de)(s, ps))(d))
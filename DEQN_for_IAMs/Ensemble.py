@@ -0,0 +1,104 @@
+# Ensemble of independent policy networks (one per parameterization) evaluated as one batched network
+
+import os
+import numpy as np
+import tensorflow as tf
+from omegaconf import OmegaConf
+
+"""
+Overview:
+    - the K members of an ensemble share the states, policies and network architecture, only their constants differ
+    - states and policies carry the ensemble axis in front of the batch axis: [..., K, batch, n]
+    - constants that differ between the members are [K, 1] tensors, which broadcast against every [..., K, batch] variable,
+      so the model Definitions and Equations are evaluated for all members at once without changes
+    - EnsembleDense holds a [K, in, out] kernel and multiplies all members with one batched product, the members are
+      trained independently, as their losses are summed and the optimizer updates are elementwise
+    - export_members writes every member as a regular run directory (network checkpoint and config), e.g. for post-processing
+"""
+
+def member_constants(names, config_dir):
+    """ The constants of every member, loaded from config/constants/<name>.yaml """
+    constants = [dict(OmegaConf.to_container(OmegaConf.load(os.path.join(config_dir, "constants", name + ".yaml")))["constants"]) for name in names]
+    for name, c in zip(names[1:], constants[1:]):
+        if set(c.keys()) != set(constants[0].keys()):
+            raise ValueError("The ensemble members " + names[0] + " and " + name + " do not have the same constants.")
+    return constants
+
+def stack_constants(constants):
+    """ Constants that are the same for all members stay python numbers, the others become [K, 1] tensors """
+    stacked = {}
+    for key in constants[0].keys():
+        values = [c[key] for c in constants]
+        if all(v == values[0] for v in values):
+            stacked[key] = values[0]
+        else:
+            stacked[key] = tf.constant([[v] for v in values], dtype=tf.float32)
+    return stacked
+
+class EnsembleDense(tf.keras.layers.Layer):
+    """ K independent dense layers applied to a [K, batch, in] tensor with one batched matrix product """
+    def __init__(self, ensemble_size, units, activation=None, kernel_initializer='glorot_uniform', **kwargs):
+        super().__init__(**kwargs)
+        self.ensemble_size = ensemble_size
+        self.units = units
+        self.activation = tf.keras.activations.get(activation)
+        self.kernel_initializer = tf.keras.initializers.get(kernel_initializer)
+
+    def build(self, input_shape):
+        n_in = int(input_shape[-1])
+        # every member is initialized like a single dense layer (the fan-in of a [K, in, out] kernel would count the members)
+        member_initializer = lambda shape, dtype=None: tf.stack([self.kernel_initializer([n_in, self.units], dtype=dtype) for _ in range(self.ensemble_size)])
+        self.kernel = self.add_weight("kernel", shape=[self.ensemble_size, n_in, self.units], initializer=member_initializer)
+        self.bias = self.add_weight("bias", shape=[self.ensemble_size, 1, self.units], initializer="zeros")
+        super().build(input_shape)
+
+    def call(self, inputs):
+        return self.activation(tf.einsum('kbi,kio->kbo', inputs, self.kernel) + self.bias)
+
+    def get_config(self):
+        config = super().get_config()
+        config.update({"ensemble_size": self.ensemble_size, "units": self.units, "activation": tf.keras.activations.serialize(self.activation),
+                       "kernel_initializer": tf.keras.initializers.serialize(self.kernel_initializer)})
+        return config
+
+def apply(network, x, ensemble_size):
+    """ Evaluates an ensemble network on [..., K, batch, n] states, the result has the shape [..., K, batch, m] """
+    shape = tf.shape(x)
+    n = x.shape[-1]
+    # [L, K, batch, n] -> [K, L * batch, n]
+    members = tf.reshape(tf.transpose(tf.reshape(x, [-1, ensemble_size, shape[-2], n]), [1, 0, 2, 3]), [ensemble_size, -1, n])
+    y = network(members)
+    m = y.shape[-1]
+    y = tf.transpose(tf.reshape(y, [ensemble_size, -1, shape[-2], m]), [1, 0, 2, 3])
+    return tf.reshape(y, tf.concat([shape[:-1], [m]], axis=0))
+
+def member_network(network, k, n_states):
+    """ A regular network (Dense instead of EnsembleDense layers) with the weights of member k """
+    layers = []
+    for layer in network.layers:
+        if isinstance(layer, EnsembleDense):
+            layers.append(tf.keras.layers.Dense(units=layer.units, activation=layer.activation))
+        else:
+            layers.append(layer.__class__.from_config(layer.get_config()))
+    member = tf.keras.models.Sequential(layers)
+    member.build(input_shape=(None, n_states))
+    for source, target in zip(network.layers, member.layers):
+        if isinstance(source, EnsembleDense):
+            target.set_weights([source.kernel[k].numpy(), source.bias[k, 0].numpy()])
+    return member
+
+def export_members(network, names, constants, starting_state, episode, log_dir, n_states):
+    """ Writes every member to <log_dir>/members/<name> as a run directory with a network checkpoint and a config """
+    run_config = OmegaConf.load(os.path.join(log_dir, ".hydra", "config.yaml"))
+    for k, name in enumerate(names):
+        member_dir = os.path.join(log_dir, "members", name)
+        member = member_network(network, k, n_states)
+        checkpoint = tf.train.Checkpoint(policy=member, current_episode=tf.Variable(episode), starting_state=tf.Variable(starting_state[k]))
+        tf.train.CheckpointManager(checkpoint, member_dir, max_to_keep=1).save(checkpoint_number=episode)
+
+        member_config = OmegaConf.create(OmegaConf.to_container(run_config))
+        member_config.constants.constants = constants[k]
+        member_config.run.ensemble = None
+        os.makedirs(os.path.join(member_dir, ".hydra"), exist_ok=True)
+        OmegaConf.save(config=member_config, f=os.path.join(member_dir, ".hydra", "config.yaml"))
+    print("Ensemble members written to " + os.path.join(log_dir, "members"))
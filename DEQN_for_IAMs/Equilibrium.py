@@ -4,59 +4,75 @@ import importlib
 import tensorflow as tf
 import PolicyState 
 import Definitions
-from Parameters import definition_bounds_hard, horovod_worker, MODEL_NAME, optimizer, policy_bounds_hard
+from Parameters import definition_bounds_hard, MODEL_NAME, policy, policy_bounds_hard, starting_state
 
 Equations = importlib.import_module(MODEL_NAME + ".Equations")
 
-def penalty_bounds_policy(state, policy_state):
+scalar_names_cache = []
+
+def scalar_names():
+    """ Names of the equation losses and penalties returned by loss_terms (evaluated once on a single state) """
+    if not scalar_names_cache:
+        # evaluated eagerly, also when first called while tracing a graph
+        with tf.init_scope():
+            state = starting_state[..., 0:1, :]
+            scalar_names_cache.extend(loss_terms(state, policy(state))[2].keys())
+    return scalar_names_cache
+
+def equation_names():
+    """ Names of the equilibrium conditions in the order returned by Equations.equations """
+    return [name[len('dev_'):] for name in scalar_names() if name.startswith('dev_')]
+
+def penalty_bounds(bounds, name, bounded_and_raw, scalars):
     res = tf.constant(0.0)
-    for bound_vars in policy_bounds_hard['lower'].keys():
-        # bounded is always >= raw - we measure how strong this bound is
-        raw_vs_bounded = getattr(PolicyState, bound_vars )(policy_state) - getattr(PolicyState, bound_vars + "_RAW")(policy_state)
-        penalty = tf.math.reduce_sum(policy_bounds_hard['penalty_lower'][bound_vars] * (raw_vs_bounded ** 2))
-        tf.summary.scalar('penalty_lower_policy_'+bound_vars, penalty)
-        res += penalty
-    
-    for bound_vars in policy_bounds_hard['upper'].keys():
-        # bounded is always <= raw - we measure how strong this bound is
-        raw_vs_bounded = getattr(PolicyState, bound_vars + "_RAW")(policy_state) - getattr(PolicyState, bound_vars )(policy_state) 
-        penalty = tf.math.reduce_sum(policy_bounds_hard['penalty_upper'][bound_vars] * (raw_vs_bounded ** 2))
-        if not horovod_worker:
-            tf.summary.scalar('penalty_upper_policy_' + bound_vars, penalty)
-        res += penalty
-    
-    for bound_vars in definition_bounds_hard['lower'].keys():
-        # bounded is always >= raw - we measure how strong this bound is
-        raw_vs_bounded = getattr(Definitions, bound_vars )(state, policy_state) - getattr(Definitions, bound_vars + "_RAW")(state, policy_state)
-        penalty = tf.math.reduce_sum(definition_bounds_hard['penalty_lower'][bound_vars] * (raw_vs_bounded ** 2))
-        if not horovod_worker:
-            tf.summary.scalar('penalty_lower_def_'+bound_vars, penalty)
-        res += penalty
+    bound_vars_all = list(bounds['lower'].keys()) + [v for v in bounds['upper'].keys() if v not in bounds['lower']]
+    for bound_vars in bound_vars_all:
+        # raw and bounded value come from one evaluation and are used for both bounds
+        bounded, raw = bounded_and_raw(bound_vars)
+        
+        if bound_vars in bounds['lower']:
+            # bounded is always >= raw - we measure how strong this bound is
+            raw_vs_bounded = bounded - raw
+            penalty = tf.math.reduce_sum(bounds['penalty_lower'][bound_vars] * (raw_vs_bounded ** 2))
+            scalars['penalty_lower_' + name + '_' + bound_vars] = penalty
+            res += penalty
+        
+        if bound_vars in bounds['upper']:
+            # bounded is always <= raw - we measure how strong this bound is
+            raw_vs_bounded = raw - bounded
+            penalty = tf.math.reduce_sum(bounds['penalty_upper'][bound_vars] * (raw_vs_bounded ** 2))
+            scalars['penalty_upper_' + name + '_' + bound_vars] = penalty
+            res += penalty
     
-    for bound_vars in definition_bounds_hard['upper'].keys():
-        # bounded is always <= raw - we measure how strong this bound is
-        raw_vs_bounded = getattr(Definitions, bound_vars + "_RAW")(state, policy_state) - getattr(Definitions, bound_vars )(state, policy_state)
-        penalty = tf.math.reduce_sum(definition_bounds_hard['penalty_upper'][bound_vars] * (raw_vs_bounded ** 2))
-        if not horovod_worker:
-            tf.summary.scalar('penalty_upper_def_' + bound_vars, penalty)
-        res += penalty
+    return res
+
+def penalty_bounds_policy(state, policy_state, scalars=None):
+    if scalars is None:
+        scalars = {}
+    res = penalty_bounds(policy_bounds_hard, 'policy', lambda bound_vars: getattr(PolicyState, bound_vars + "_AND_RAW")(policy_state), scalars)
+    res += penalty_bounds(definition_bounds_hard, 'def', lambda bound_vars: getattr(Definitions, bound_vars + "_AND_RAW")(state, policy_state), scalars)
     
     return res
 
-def loss(state, policy_state):
-    loss_val = tf.constant(0.0)         # total loss
-    net_loss_val = tf.constant(0.0)     # net loss (without penalty)
-    tf.summary.experimental.set_step(optimizer.iterations)
-    losses = Equations.equations(state, policy_state)
-    for eq_f in losses.keys():
-        eq_loss = tf.math.reduce_sum((losses[eq_f]) ** 2)
-        if not horovod_worker:
-            tf.summary.scalar('dev_' + eq_f, eq_loss)
-        loss_val += eq_loss
-        
-    net_loss_val = loss_val
-    loss_val += penalty_bounds_policy(state, policy_state)
-    #normalize loss with number of equations
-    no_eq = len(losses)
+def loss_terms(state, policy_state, sample_losses=None):
+    """ Total loss, net loss (without penalty) and a dictionary with every equation loss and penalty.
+    If sample_losses is a dictionary, the squared residual of every equation is added to it per sample.
+    Contains no summary ops, so it can be compiled with XLA. """
+    scalars = {}
+    with Definitions.evaluation_context():
+        loss_val = tf.constant(0.0)         # total loss
+        net_loss_val = tf.constant(0.0)     # net loss (without penalty)
+        losses = Equations.equations(state, policy_state)
+        for eq_f in losses.keys():
+            eq_loss = tf.math.reduce_sum((losses[eq_f]) ** 2)
+            if sample_losses is not None:
+                sample_losses[eq_f] = tf.reshape(losses[eq_f] ** 2, [-1])
+            scalars['dev_' + eq_f] = eq_loss
+            loss_val += eq_loss
+            
+        net_loss_val = loss_val
+        loss_val += penalty_bounds_policy(state, policy_state, scalars)
+        #normalize loss with number of equations
+        no_eq = len(losses)
     
-    return loss_val/no_eq, net_loss_val/no_eq
+    return loss_val/no_eq, net_loss_val/no_eq, scalars
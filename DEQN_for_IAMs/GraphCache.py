@@ -0,0 +1,113 @@
+# Persistent cache of traced graphs (SavedModel concrete functions), keyed by a hash of the configuration and the model code
+
+import glob
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import tensorflow as tf
+
+"""
+Overview:
+    - the key hashes the parts of the configuration the cached graphs depend on (model, variables, network, the run keys in
+      GRAPH_RUN_KEYS, the optimizer keys in GRAPH_OPTIMIZER_KEYS and the names of the constants, whose values are variables,
+      see Constants.py), the sources of the model package and the TF version
+    - the first run of a configuration traces the functions and exports them to <cache_dir>/<key>, later runs (e.g. short
+      post-processing jobs) load the exported concrete functions instead of tracing them
+    - restored functions read restored copies of the variables they capture (network weights, constants, ...), the live
+      variables are assigned to these copies before every call, which copies the weights but does not retrace, and the
+      variables the functions update (e.g. the state of the random generator) are copied back after the call
+    - the gradient kernel (loss and gradients of a minibatch) is cached as well, the optimizer applies its gradients to the live
+      weights, so the optimizer step itself is traced as before; it is not cached for networks with dropout or batch
+      normalization (which depend on the learning phase) or with loss scaling (the scale is a variable of the optimizer)
+"""
+
+GRAPH_RUN_KEYS = ['N_episode_length', 'keras_precision', 'xla_compile', 'ensemble', 'expectation_type', 'quadrature_level', 'expectation_pseudo_draws']
+# the optimizer keys the gradient kernel depends on
+GRAPH_OPTIMIZER_KEYS = ['loss_scale', 'clipvalue']
+
+def source_hash(model_name, root=None):
+    """ Hash of the python sources of the model package and of the top level modules """
+    root = root or os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha256()
+    for filename in sorted(glob.glob(os.path.join(root, "*.py")) + glob.glob(os.path.join(root, model_name, "*.py"))):
+        with open(filename, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def cache_key(config, constants, xla_enabled):
+    run = config.get('run', {})
+    keyed = {
+        "MODEL_NAME": config['MODEL_NAME'],
+        "variables": config.get('variables'),
+        "net": config.get('net'),
+        "run": {k: run.get(k) for k in GRAPH_RUN_KEYS},
+        "optimizer": {k: config.get('optimizer', {}).get(k) for k in GRAPH_OPTIMIZER_KEYS},
+        # numeric constants are variables, only their names and shapes enter the graphs
+        "constants": {k: (list(v.shape) if isinstance(v, tf.Variable) else v) for k, v in constants.items()},
+        "xla": xla_enabled,
+        "tensorflow": tf.__version__,
+        "sources": source_hash(config['MODEL_NAME']),
+    }
+    return hashlib.sha256(json.dumps(keyed, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+class GraphCache:
+    def __init__(self, directory, live_variables, updated_variables=()):
+        self.directory = directory
+        self.live_variables = list(live_variables)
+        # indices of the variables the cached functions update
+        self.updated = [i for i, v in enumerate(self.live_variables) if any(v is u for u in updated_variables)]
+        self.loaded = None
+
+    def export(self, functions):
+        """ Saves the tf.functions (each with an input_signature) together with the variables they capture """
+        root = tf.Module()
+        root.cached_variables = self.live_variables
+        for name, function in functions.items():
+            setattr(root, name, function)
+        # every writer exports into a directory of its own, the first one to finish publishes it
+        tmp_directory = tempfile.mkdtemp(dir=os.path.dirname(self.directory), prefix=os.path.basename(self.directory) + ".tmp")
+        try:
+            tf.saved_model.save(root, tmp_directory)
+            os.rename(tmp_directory, self.directory)
+        except OSError:
+            # another run exported the same key first
+            if not os.path.exists(self.directory):
+                raise
+        finally:
+            shutil.rmtree(tmp_directory, ignore_errors=True)
+
+    def load(self):
+        self.loaded = tf.saved_model.load(self.directory)
+        if len(self.loaded.cached_variables) != len(self.live_variables):
+            raise ValueError("The graph cache " + self.directory + " does not match the variables of this run.")
+
+    def cached(self, name):
+        return self.loaded is not None and hasattr(self.loaded, name)
+
+    def __call__(self, name, *args):
+        for cached, live in zip(self.loaded.cached_variables, self.live_variables):
+            cached.assign(live)
+        result = getattr(self.loaded, name)(*args)
+        for i in self.updated:
+            self.live_variables[i].assign(self.loaded.cached_variables[i])
+        return result
+
+def open_cache(cache_dir, key, functions, live_variables, updated_variables=()):
+    """ The cache of the given functions (name -> tf.function with an input_signature), exported first if there is none
+    for the key yet, None if the functions can not be exported or loaded """
+    os.makedirs(cache_dir, exist_ok=True)
+    cache = GraphCache(os.path.join(cache_dir, key), live_variables, updated_variables)
+    start = time.time()
+    try:
+        if not os.path.exists(cache.directory):
+            cache.export(functions)
+            print("Traced graphs exported to the graph cache " + cache.directory + " in {:.2f}s".format(time.time() - start))
+        cache.load()
+        print("Traced graphs loaded from the graph cache " + cache.directory + " in {:.2f}s".format(time.time() - start))
+    except (ValueError, TypeError, AssertionError, OSError, tf.errors.OpError) as e:
+        print("WARNING: the graph cache can not be used, the graphs are traced: " + str(e).split("\n")[0])
+        return None
+    return cache
@@ -1,8 +1,20 @@
 import importlib
 import tensorflow as tf
+import Checkpointing
+import Compile
+import Convergence
+import Ensemble
 import Equilibrium
+import GraphCache
+import Metrics
+import Profiling
+import Replay
+import State
+import Summaries
 import Parameters
+import atexit
 import gc
+import math
 
 if Parameters.horovod:
     import horovod.tensorflow as hvd
@@ -15,37 +27,88 @@ Overview:
     - Episode > Epochs (1 full scan of an episode) > Mini-batches > Adam
 """
 
-@tf.function 
-def do_random_step(current_state):
-    return Dynamics.total_step_random(current_state, Parameters.policy(current_state))
+def episode_simulator(step_fn):
+    """ Compiles a full rollout of step_fn (mapping a state batch to the next state batch) into a single graph.
+    
+    The simulated states are written into a preallocated TensorArray, so the whole episode is built in one while loop
+    instead of rewriting the complete [N_episode_length, N_sim_batch, n_states] tensor after every step.
+    The episode length is a python integer, as XLA needs the size of the TensorArray at compile time.
+    """
+    @Compile.function
+    def simulate(starting_state, episode_length):
+        states_ta = tf.TensorArray(starting_state.dtype, size=episode_length, element_shape=starting_state.shape)
+        states_ta = states_ta.write(0, starting_state)
+        current_state = starting_state
+        for i in tf.range(1, episode_length):
+            current_state = step_fn(current_state)
+            states_ta = states_ta.write(i, current_state)
+            
+        return states_ta.stack()
+    
+    return simulate
+
+simulate_random_episode = episode_simulator(lambda current_state: Dynamics.total_step_random(current_state, Parameters.policy(current_state)))
+# replace above for deterministic results
+# simulate_random_episode = episode_simulator(lambda current_state: Dynamics.total_step_spec_shock(current_state, Parameters.policy(current_state), 0))
 
 def run_episode(state_episode):
-    """ Runs an episode starting from the begging of the state_episode. Results are saved into state_episode."""
-    current_state = state_episode[0,:,:]
-    
-    # run optimization
-    for i in range(1, state_episode.shape[0]):
-        current_state = do_random_step(current_state)
-        # replace above for deterministic results
-        # current_state = BatchState.total_step_spec_shock(current_state, Parameters.policy(current_state),0)
-        state_episode = tf.tensor_scatter_nd_update(state_episode, tf.constant([[ i ]]), tf.expand_dims(current_state, axis=0))
+    """ Runs an episode starting from the begging of the state_episode. Results are returned in a tensor of the same shape."""
+    if graph_cache is not None and state_episode.shape[0] == Parameters.N_episode_length:
+        return graph_cache("simulate", state_episode[0])
+    return simulate_random_episode(state_episode[0], state_episode.shape[0])
+
+def loss_and_gradients(state_sample):
+    """Loss (with and without penalties), gradients with respect to the policy network, the individual
+    equation losses and penalties and the priority (squared residuals) of every sample for a minibatch"""
+    sample_losses = {}
+    with tf.GradientTape() as tape:
+        loss, net_loss, scalars = Equilibrium.loss_terms(state_sample, Parameters.policy(state_sample), sample_losses)
+        scaled_loss = Parameters.optimizer.get_scaled_loss(loss) if Parameters.loss_scaling else loss
+        
+    grads = tape.gradient(scaled_loss, Parameters.policy_net.trainable_variables)
+    if Parameters.loss_scaling:
+        grads = Parameters.optimizer.get_unscaled_gradients(grads)
+        if Parameters.gradient_clipvalue is not None:
+            # non-finite gradients are kept, so a dynamic loss scale still skips the step and lowers the scale
+            grads = [tf.where(tf.math.is_finite(g), tf.clip_by_value(g, -Parameters.gradient_clipvalue, Parameters.gradient_clipvalue), g) for g in grads]
     
-    return state_episode
+    return loss, net_loss, grads, scalars, Replay.sample_priorities(sample_losses)
 
-@tf.function
-def run_grads(state_sample, first_batch):
-    """Runs a single gradient step using Adam for a minibatch"""
-    with Parameters.writer.as_default():
-        with tf.GradientTape() as tape:
-            loss, net_loss = Equilibrium.loss(state_sample, Parameters.policy(state_sample))
+gradient_kernel = Compile.function(loss_and_gradients)
 
+def replica_gradient_step(state_sample):
+    """Single gradient step on the minibatch of one worker"""
+    loss, net_loss, grads, scalars, priorities = gradient_kernel(state_sample)
+    
+    with Parameters.writer.as_default():
+        Summaries.write(scalars)
+    
     if Parameters.horovod:
-        # Horovod: add Horovod Distributed GradientTape.
-        tape = hvd.DistributedGradientTape(tape)
+        # Horovod: average the gradients over all workers.
+        grads = [hvd.allreduce(grad) for grad in grads]
+    
+    if Parameters.strategy is not None:
+        # the mirrored optimizer sums the gradients over all local workers, this turns the sum into an average
+        grads = [grad / Parameters.num_workers for grad in grads]
         
-    grads = tape.gradient(loss, Parameters.policy_net.trainable_variables)
     Parameters.optimizer.apply_gradients(zip(grads, Parameters.policy_net.trainable_variables))
     
+    return loss, net_loss, tf.stack([scalars['dev_' + eq] for eq in Equilibrium.equation_names()]), priorities
+
+def gradient_step(state_sample):
+    """Single gradient step on a minibatch, to be called from inside a compiled function"""
+    if Parameters.strategy is None:
+        return replica_gradient_step(state_sample)
+    
+    # every local worker trains on its own minibatch, the gradients are all-reduced inside the step
+    results = Parameters.strategy.run(replica_gradient_step, args=(state_sample,))
+    return tuple(Parameters.strategy.experimental_local_results(result)[0] for result in results)
+
+@Compile.function(jit=False)
+def run_grads(state_sample, first_batch):
+    """Runs a single gradient step using Adam for a minibatch"""
+    loss, net_loss, equation_losses, _ = gradient_step(state_sample)
+    
     # Note: broadcast should be done after the first gradient step to ensure optimizer
     # initialization.
     if first_batch:
@@ -53,65 +116,225 @@ def run_grads(state_sample, first_batch):
         hvd.broadcast_variables(Parameters.policy_net.variables, root_rank=0)
         hvd.broadcast_variables(Parameters.optimizer.variables(), root_rank=0)
     
-    return loss, net_loss
+    return loss, net_loss, equation_losses
 
-def run_epoch(state_episode):
+@Compile.function(jit=False)
+def run_epoch_compiled(state_episode, N_minibatch_size):
+    """Runs a full epoch (permutation, minibatch slicing, gradient steps and loss accumulation) in a single graph call.
+    Returns the summed loss, net loss and equation losses (in the order of Equilibrium.equation_names) of the epoch.
+    The minibatch size is a python integer, every size the minibatch grows to is traced once."""
+    n_states = len(Parameters.states)
+    # we have a larger effective sample size as we batch simulated
+    effective_size = state_episode.shape[0] * state_episode.shape[-2]
+    n_batches = effective_size // N_minibatch_size
+    if n_batches == 0:
+        # an epoch without a minibatch would report a loss of 0 and a false convergence
+        raise ValueError("The minibatch size " + str(N_minibatch_size) + " is larger than the " + str(effective_size) + " states of an episode.")
+    
+    if not Parameters.sorted_within_batch:
+        episode = tf.transpose(state_episode, [1, 0, 2, 3]) if Parameters.ensemble else state_episode
+        order = tf.random.shuffle(tf.range(effective_size))[:n_batches * N_minibatch_size]
+    else:
+        # trajectories stay contiguous inside a minibatch, only the order of the minibatches is shuffled
+        episode = tf.transpose(state_episode, [1, 2, 0, 3] if Parameters.ensemble else [1, 0, 2])
+        batch_order = tf.random.shuffle(tf.range(n_batches))
+        order = tf.reshape(tf.expand_dims(batch_order, axis=1) * N_minibatch_size + tf.expand_dims(tf.range(N_minibatch_size), axis=0), [-1])
+    
+    # every member of an ensemble keeps its own samples, all members train on the same positions of their episodes
+    samples = tf.reshape(episode, [Parameters.ensemble_size, effective_size, n_states] if Parameters.ensemble else [effective_size, n_states])
+    sample_axis = 1 if Parameters.ensemble else 0
+    order = tf.reshape(order, [n_batches, N_minibatch_size])
+    epoch_loss = tf.constant(0.0)
+    net_epoch_loss = tf.constant(0.0)
+    equation_epoch_losses = tf.zeros([len(Equilibrium.equation_names())])
+    
+    for b in tf.range(n_batches):
+        epoch_loss_1, net_epoch_loss_1, equation_losses_1, _ = gradient_step(tf.gather(samples, order[b], axis=sample_axis))
+        epoch_loss += epoch_loss_1
+        net_epoch_loss += net_epoch_loss_1
+        equation_epoch_losses += equation_losses_1
+    
+    return epoch_loss, net_epoch_loss, equation_epoch_losses
+
+# states of past episodes, sampled by their residuals (disabled with replay_buffer_size: 0)
+replay = None
+if Parameters.replay_buffer_size:
+    if Parameters.ensemble:
+        raise ValueError("The replay buffer can not be used with an ensemble (run.ensemble).")
+    if Parameters.replay_buffer_size < Parameters.N_episode_length * Parameters.N_sim_batch:
+        raise ValueError("The replay buffer (replay_buffer_size) must hold at least one episode of N_episode_length * N_sim_batch states.")
+    replay = Replay.ReplayBuffer(Parameters.replay_buffer_size, len(Parameters.states), Parameters.replay_alpha, Parameters.replay_min_priority)
+
+@Compile.function(jit=False)
+def run_epoch_replay(N_minibatch_size, n_batches):
+    """Runs an epoch of n_batches gradient steps on minibatches drawn from the replay buffer by priority,
+    the trained states get the residuals of the step as their new priority"""
+    epoch_loss = tf.constant(0.0)
+    net_epoch_loss = tf.constant(0.0)
+    equation_epoch_losses = tf.zeros([len(Equilibrium.equation_names())])
+    
+    for b in tf.range(n_batches):
+        indices = replay.sample(N_minibatch_size)
+        epoch_loss_1, net_epoch_loss_1, equation_losses_1, priorities = gradient_step(tf.gather(replay.states, indices))
+        replay.update(indices, priorities)
+        epoch_loss += epoch_loss_1
+        net_epoch_loss += net_epoch_loss_1
+        equation_epoch_losses += equation_losses_1
+    
+    return epoch_loss, net_epoch_loss, equation_epoch_losses
+
+def run_epoch_dataset(state_episode, N_minibatch_size):
     # we have a larger effective sample size as we batch simulated
     effective_size = state_episode.shape[0] * state_episode.shape[1]
     if not Parameters.sorted_within_batch:
-        batches =  tf.data.Dataset.from_tensor_slices(tf.reshape(state_episode, [effective_size,len(Parameters.states)])).shuffle(buffer_size=effective_size).batch(Parameters.N_minibatch_size, drop_remainder=True)
+        batches =  tf.data.Dataset.from_tensor_slices(tf.reshape(state_episode, [effective_size,len(Parameters.states)])).shuffle(buffer_size=effective_size).batch(N_minibatch_size, drop_remainder=True)
     else:
-        batches = tf.data.Dataset.from_tensor_slices(tf.reshape(tf.transpose(state_episode,[1,0,2]), [effective_size,len(Parameters.states)])).batch(Parameters.N_minibatch_size, drop_remainder=True).shuffle(buffer_size=int(effective_size/Parameters.N_minibatch_size))
+        batches = tf.data.Dataset.from_tensor_slices(tf.reshape(tf.transpose(state_episode,[1,0,2]), [effective_size,len(Parameters.states)])).batch(N_minibatch_size, drop_remainder=True).shuffle(buffer_size=int(effective_size/N_minibatch_size))
     epoch_loss = 0.0
     net_epoch_loss = 0.0
+    equation_epoch_losses = 0.0
     
     for batch in batches:
-        epoch_loss_1, net_epoch_loss_1 = run_grads(batch, Parameters.horovod and Parameters.optimizer.iterations == Parameters.optimizer_starting_iteration)    
+        # a tensor, so the first and the following batches share one trace
+        first_batch = tf.constant(Parameters.horovod and bool(Parameters.optimizer.iterations == Parameters.optimizer_starting_iteration))
+        epoch_loss_1, net_epoch_loss_1, equation_losses_1 = run_grads(batch, first_batch)
         epoch_loss += epoch_loss_1
         net_epoch_loss += net_epoch_loss_1
+        equation_epoch_losses += equation_losses_1
             
-    return epoch_loss, net_epoch_loss
+    return epoch_loss, net_epoch_loss, equation_epoch_losses
+
+def run_epoch(state_episode):
+    # horovod needs the variables broadcast after the first gradient step, which is done minibatch-by-minibatch in run_grads
+    if Parameters.horovod:
+        if Parameters.ensemble:
+            raise ValueError("Ensembles (run.ensemble) are not supported with horovod.")
+        return run_epoch_dataset(state_episode, Parameters.minibatch_growth.size())
+    
+    if replay is not None:
+        # as many minibatches as an epoch over the episode, but drawn from the whole buffer
+        return run_epoch_replay(Parameters.minibatch_growth.size(), (state_episode.shape[0] * state_episode.shape[1]) // Parameters.minibatch_growth.size())
+    
+    return run_epoch_compiled(state_episode, Parameters.minibatch_growth.size())
  
+# samples per epoch, the losses of an ensemble are summed over its members
+n_samples = Parameters.N_episode_length * Parameters.N_sim_batch * Parameters.ensemble_size
+
+# created with the first training cycle, as the names of the equations need an evaluation of the equations
+# (scripts that only simulate, e.g. the post-processing, do not pay for it at import)
+metrics = None
+convergence = None
+
+def init_training_logs():
+    global metrics, convergence
+    if metrics is not None:
+        return
+    # only the first worker writes the metrics log, the buffered epochs are flushed every metrics_flush_every episodes and at exit
+    metrics = Metrics.MetricsLog(Parameters.LOG_DIR + "/" + Parameters.metrics_filename, Equilibrium.equation_names(), n_samples, Parameters.metrics_flush_every, enabled=not Parameters.horovod_worker)
+    atexit.register(metrics.flush)
+    convergence = Convergence.ConvergenceMonitor(Equilibrium.equation_names(), n_samples, Parameters.convergence_smoothing, Parameters.convergence_tolerance,
+                                                 Parameters.convergence_equation_tolerance, Parameters.convergence_patience, Parameters.convergence_min_delta, Parameters.convergence_min_episodes)
+    # the variables of the summary schedule are created here, eagerly, and not in the replica context of the first gradient step
+    Summaries.init()
+
+# wall time of the phases of every episode, logged next to the metrics
+timers = Profiling.PhaseTimers(['simulation', 'replay', 'epochs', 'bookkeeping', 'checkpoint', 'hooks', 'gc'])
+timings = Metrics.PhaseLog(Parameters.LOG_DIR + "/" + Parameters.timings_filename, timers.phases + ['other', 'total'], Parameters.metrics_flush_every, enabled=not Parameters.horovod_worker)
+atexit.register(timings.flush)
+profiler = Profiling.ProfilerWindow(Parameters.LOG_DIR, Parameters.profile_episodes, enabled=not Parameters.horovod_worker)
+atexit.register(profiler.stop)
+Profiling.startup.mark("model modules")
+
+def gradient_kernel_cacheable():
+    """ True if the traced gradient kernel does not depend on the learning phase or on the loss scale (which live outside
+    of the variables the cache copies), i.e. the network has no dropout or batch normalization and the loss is not scaled """
+    if Parameters.loss_scaling:
+        return False
+    return not any(isinstance(layer, (tf.keras.layers.Dropout, tf.keras.layers.BatchNormalization)) for layer in Parameters.policy_net.layers)
+
+def open_graph_cache():
+    """ The episode simulation, the gradient kernel and the batched policy from the persistent graph cache (see GraphCache.py),
+    None if the cache is disabled """
+    if not Parameters.graph_cache_dir:
+        return None
+    if Parameters.num_workers > 1 or Parameters.horovod:
+        print("The graph cache is not used in data-parallel runs.")
+        return None
+    # any number of trajectories (or samples of a minibatch)
+    state_shape = list(Parameters.starting_state.shape)
+    state_shape[-2] = None
+    state_spec = tf.TensorSpec(state_shape, Parameters.starting_state.dtype)
+    functions = {"simulate": tf.function(lambda starting_state: simulate_random_episode.tf_function(starting_state, Parameters.N_episode_length), input_signature=[state_spec])}
+    if gradient_kernel_cacheable():
+        # loss and gradients only, the optimizer applies the gradients to the live variables
+        functions["gradient_kernel"] = tf.function(lambda state_sample: gradient_kernel.tf_function(state_sample), input_signature=[state_spec])
+        if not Parameters.ensemble:
+            functions["batched_policy"] = tf.function(lambda next_states: State.batched_policy.tf_function(next_states), input_signature=[state_spec])
+    live_variables = Parameters.policy_net.variables + list(Parameters.constants.variables.values()) + [Parameters.rng.state]
+    key = GraphCache.cache_key(Parameters.config, dict(Parameters.constants.items()), Compile.xla_enabled)
+    return GraphCache.open_cache(Parameters.graph_cache_dir, key, functions, live_variables, updated_variables=[Parameters.rng.state])
+
+graph_cache = open_graph_cache()
+if graph_cache is not None and graph_cache.cached("gradient_kernel"):
+    gradient_kernel = lambda state_sample: graph_cache("gradient_kernel", state_sample)
+    # the cached policy is not differentiable with respect to the live weights, it is only used once the gradient kernel is cached,
+    # i.e. by the expectations outside of the gradient steps (hooks, post-processing)
+    if graph_cache.cached("batched_policy"):
+        State.batched_policy = lambda next_states: graph_cache("batched_policy", next_states)
+Profiling.startup.mark("graph cache")
+
 def run_cycle(state_episode):
     """ Runs an iteration cycle startin from a given BatchState.
     
     It creates an episode and then runs N_epochs_per_episode epochs on the data.
     """
     
-    state_episode = run_episode(state_episode)
+    init_training_logs()
+    with timers.phase('simulation'):
+        state_episode = run_episode(state_episode)
+    
+    if replay is not None:
+        with timers.phase('replay'):
+            replay.add(tf.reshape(state_episode, [-1, len(Parameters.states)]))
+            if Parameters.replay_refresh_every and int(Parameters.ckpt.current_episode.numpy()) % Parameters.replay_refresh_every == 0:
+                replay.refresh(Parameters.N_minibatch_size)
 
     # starting learning phase - needed for DROPOUT layer to become active
     tf.keras.backend.set_learning_phase(1)
 
-    file1 = open(Parameters.LOG_DIR + "/" + Parameters.error_filename,"a") 
-    for e in range(Parameters.N_epochs_per_episode):
-        #print("Current Time (before epoch) =", datetime.now().strftime("%H:%M:%S"))
-        epoch_loss, net_epoch_loss = run_epoch(state_episode)
-        MSE_epoch_loss = epoch_loss / (Parameters.N_episode_length * Parameters.N_sim_batch)
-        Norm_epoch_loss = tf.math.sqrt(epoch_loss / (Parameters.N_episode_length * Parameters.N_sim_batch))
-        MSE_epoch_no_penalty = net_epoch_loss / (Parameters.N_episode_length * Parameters.N_sim_batch)
-        Norm_epoch_loss_no_penalty = tf.math.sqrt(net_epoch_loss / (Parameters.N_episode_length * Parameters.N_sim_batch))
-        
-        tf.print("----------------------------------")
-        tf.print("Normalized MSE epoch loss: " + str(MSE_epoch_loss))
-        tf.print("Normalized epoch loss: " + str(Norm_epoch_loss))
-        tf.print("----------------------------------")
-        tf.print("Normalized MSE epoch loss without penalties: " + str(MSE_epoch_no_penalty))
-        tf.print("Normalized epoch loss without penalties: " + str(Norm_epoch_loss_no_penalty))
-        tf.print("==================================")
-        file1.write("MSE:            " + str(tf.get_static_value(MSE_epoch_loss)) + "  ")
-        file1.write("MAE:            " + str(tf.get_static_value(Norm_epoch_loss)) + "  ")
-        file1.write("MSE_no_penalty: " + str(tf.get_static_value(MSE_epoch_no_penalty)) + "  ")
-        file1.write("MAE_no_penatly: " + str(tf.get_static_value(Norm_epoch_loss_no_penalty)) + "\n")
-        
-    file1.close() 
-
+    episode = int(Parameters.ckpt.current_episode.numpy())
+    with timers.phase('epochs'):
+        for e in range(Parameters.N_epochs_per_episode):
+            #print("Current Time (before epoch) =", datetime.now().strftime("%H:%M:%S"))
+            epoch_loss, net_epoch_loss, equation_epoch_losses = run_epoch(state_episode)
+            # the losses stay on the device until the metrics log is flushed
+            metrics.record(episode, e, epoch_loss, net_epoch_loss, equation_epoch_losses)
+    
+    with timers.phase('bookkeeping'):
+        log_episode(episode, epoch_loss, net_epoch_loss, equation_epoch_losses)
 
     # stopping learning phase
     tf.keras.backend.set_learning_phase(0)
         
     return state_episode
 
+def log_episode(episode, epoch_loss, net_epoch_loss, equation_epoch_losses):
+    """ Prints and logs the losses of the last epoch and updates the convergence monitor and the schedules """
+    metrics.end_episode()
+    # the losses are printed from the values the convergence monitor pulls to the host, which is the only sync of the episode
+    convergence.update(episode, net_epoch_loss, equation_epoch_losses, epoch_loss)
+    print("----------------------------------")
+    print("Normalized MSE epoch loss:", convergence.last_loss)
+    print("Normalized epoch loss:", math.sqrt(convergence.last_loss))
+    print("----------------------------------")
+    print("Normalized MSE epoch loss without penalties:", convergence.last_net_loss)
+    print("Normalized epoch loss without penalties:", math.sqrt(convergence.last_net_loss))
+    print("==================================")
+    # learning rate and minibatch schedules that depend on the loss
+    if Parameters.lr_plateau_reduction is not None:
+        Parameters.lr_plateau_reduction.update(convergence.smoothed_loss)
+    Parameters.minibatch_growth.update(episode, convergence.smoothed_loss)
+
 def run_cycles():
     if "post_init" in dir(Hooks) and Parameters.ckpt.current_episode < 2:
         print("Running post-init hook...")
@@ -119,19 +342,22 @@ def run_cycles():
         print("Starting state after post-init:")
         print(Parameters.starting_state)
 
-    state_episode = tf.tile(tf.expand_dims(Parameters.starting_state, axis = 0), [Parameters.N_episode_length, 1, 1])
+    state_episode = tf.tile(tf.expand_dims(Parameters.starting_state, axis = 0), [Parameters.N_episode_length] + [1] * len(Parameters.starting_state.shape))
 
     start_time = tf.timestamp()
 
     for i in range(Parameters.N_episodes):       
-        tf.print("Running episode: " + str(Parameters.ckpt.current_episode.numpy()))
+        episode = int(Parameters.ckpt.current_episode.numpy())
+        tf.print("Running episode: " + str(episode))
+        profiler.start_episode(episode)
+        timers.reset()
         state_episode = run_cycle(state_episode)
         # start again from previous last state
         if Parameters.initialize_each_episode:
             print("Running with states re-drawn after each episode!") 
             Parameters.starting_state.assign(Parameters.initialize_states())
         else:
-            Parameters.starting_state.assign(state_episode[Parameters.N_episode_length-1,:,:])
+            Parameters.starting_state.assign(state_episode[Parameters.N_episode_length-1])
             
         state_episode = tf.tensor_scatter_nd_update(state_episode, tf.constant([[ 0 ]]), tf.expand_dims(Parameters.starting_state, axis=0))
         
@@ -139,14 +365,47 @@ def run_cycles():
         Parameters.ckpt.current_episode.assign_add(1)
         
         if not Parameters.horovod_worker:
-            Parameters.manager.save()
+            # the checkpoint is written in the background
+            with timers.phase('checkpoint'):
+                Checkpointing.save(force=convergence.converged)
             # run hooks
-            with Parameters.writer.as_default():
-                Hooks.cycle_hook(state_episode[0,:,:],i)
+            with timers.phase('hooks'), Parameters.writer.as_default():
+                Hooks.cycle_hook(state_episode[0],i)
                 
         tf.print("Elapsed time since start: ", tf.timestamp() - start_time)
 
         if i % 10 == 0:
-            tf.print("Garbage collecting")
-            tf.keras.backend.clear_session()
-            gc.collect()
+            with timers.phase('gc'):
+                tf.print("Garbage collecting")
+                tf.keras.backend.clear_session()
+                gc.collect()
+        
+        if i == 0:
+            # the first episode includes the tracing of the graphs that are not cached
+            Profiling.startup.mark("first episode")
+            Profiling.startup.print_report()
+            if not Parameters.horovod_worker:
+                Profiling.startup.write_report(Parameters.LOG_DIR + "/startup.json")
+
+        profiler.end_episode(episode)
+        seconds = timers.end_episode()
+        timings.record(episode, seconds)
+        if not Parameters.horovod_worker:
+            with Parameters.writer.as_default():
+                for phase, s in seconds.items():
+                    tf.summary.scalar("seconds/" + phase, s, step=episode)
+        
+        if convergence.converged:
+            break
+    
+    if not Parameters.horovod_worker:
+        profiler.stop()
+        timings.flush()
+        if convergence is not None:
+            convergence.write_summary(Parameters.LOG_DIR + "/convergence.json")
+        Compile.print_trace_report()
+        Compile.write_trace_report(Parameters.LOG_DIR + "/traces.json")
+        Checkpointing.flush()
+        if Parameters.ensemble:
+            Ensemble.export_members(Parameters.policy_net, Parameters.ensemble_names, Parameters.ensemble_constants, Parameters.starting_state,
+                                    int(Parameters.ckpt.current_episode.numpy()), Parameters.LOG_DIR, len(Parameters.states))
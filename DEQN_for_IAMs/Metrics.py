@@ -0,0 +1,152 @@
+# Buffered training metrics, appended in batches to a CSV log in the run directory
+
+import csv
+import glob
+import math
+import os
+import sys
+import tensorflow as tf
+
+"""
+Overview:
+    - MetricsLog.record() keeps the losses of an epoch as a tensor on the device, nothing is synced with the device
+    - flush() pulls all buffered epochs with a single transfer and appends them to the CSV log
+    - the header row is the schema of the log: appending rows with different columns raises an error
+    - read_metrics() collects the logs of many run directories (also the old error_file.txt) into one pandas DataFrame
+    - PhaseLog appends the seconds spent in every phase of an episode (see Profiling.py) to a second CSV log
+
+Columns:
+    episode, epoch, MSE, MAE, MSE_no_penalty, MAE_no_penalty (as in the old error_file.txt, MAE is the square root of the MSE)
+    dev_<equation>: the mean squared residual of every equilibrium condition
+    timings log: episode and the seconds of every phase
+"""
+
+BASE_COLUMNS = ['episode', 'epoch', 'MSE', 'MAE', 'MSE_no_penalty', 'MAE_no_penalty']
+
+class MetricsLog:
+    def __init__(self, filename, equation_names, n_samples, flush_every=10, enabled=True):
+        self.filename = filename
+        self.columns = BASE_COLUMNS + ['dev_' + eq for eq in equation_names]
+        # the losses are sums over the samples of an epoch
+        self.n_samples = n_samples
+        self.flush_every = flush_every
+        self.enabled = enabled
+        self.keys = []
+        self.values = []
+        self.episodes_since_flush = 0
+
+    def record(self, episode, epoch, loss, net_loss, equation_losses):
+        """ Buffers the summed losses of one epoch """
+        if not self.enabled:
+            return
+        self.keys.append((episode, epoch))
+        self.values.append(tf.concat([tf.stack([loss, net_loss]), tf.cast(equation_losses, loss.dtype)], axis=0))
+
+    def end_episode(self):
+        """ Flushes every flush_every episodes """
+        self.episodes_since_flush += 1
+        if self.episodes_since_flush >= self.flush_every:
+            self.flush()
+
+    def check_schema(self):
+        return check_schema(self.filename, self.columns)
+
+    def flush(self):
+        self.episodes_since_flush = 0
+        if not self.values:
+            return
+
+        values = tf.stack(self.values).numpy() / self.n_samples
+        has_header = os.path.exists(self.filename) and self.check_schema()
+        with open(self.filename, 'a', newline='') as f:
+            writer = csv.writer(f)
+            if not has_header:
+                writer.writerow(self.columns)
+            for (episode, epoch), row in zip(self.keys, values):
+                mse, mse_no_penalty = float(row[0]), float(row[1])
+                writer.writerow([episode, epoch, mse, math.sqrt(mse), mse_no_penalty, math.sqrt(mse_no_penalty)] + [float(v) for v in row[2:]])
+
+        self.keys = []
+        self.values = []
+
+def check_schema(filename, columns):
+    """ True if the log has a header, which has to be columns """
+    with open(filename, newline='') as f:
+        header = next(csv.reader(f), None)
+    if header is not None and header != columns:
+        raise ValueError("The metrics log " + filename + " has the columns " + str(header) + ", but " + str(columns) + " are written.")
+    return header is not None
+
+class PhaseLog:
+    def __init__(self, filename, phases, flush_every=10, enabled=True):
+        self.filename = filename
+        self.columns = ['episode'] + ['seconds_' + p for p in phases]
+        self.phases = phases
+        self.flush_every = flush_every
+        self.enabled = enabled
+        self.rows = []
+
+    def record(self, episode, seconds):
+        """ Buffers the seconds of every phase of an episode, flushes every flush_every episodes """
+        if not self.enabled:
+            return
+        self.rows.append([episode] + [seconds[p] for p in self.phases])
+        if len(self.rows) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        has_header = os.path.exists(self.filename) and check_schema(self.filename, self.columns)
+        with open(self.filename, 'a', newline='') as f:
+            writer = csv.writer(f)
+            if not has_header:
+                writer.writerow(self.columns)
+            writer.writerows(self.rows)
+        self.rows = []
+
+def read_error_file(filename):
+    """ Reads the error_file.txt written by older versions (no episode numbers and no equation residuals) """
+    import pandas as pd
+    rows = []
+    with open(filename) as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) == 8:
+                rows.append([float(fields[i]) for i in (1, 3, 5, 7)])
+    frame = pd.DataFrame(rows, columns=BASE_COLUMNS[2:])
+    frame.insert(0, 'epoch', range(len(frame)))
+    return frame
+
+def read_metrics(run_dirs, filename='metrics.csv', legacy_filename='error_file.txt'):
+    """ One DataFrame with the metrics of all given run directories (glob patterns are expanded), the run directory
+    is added in the column 'run'. Runs with an error_file.txt instead of a metrics log are read as well. """
+    import pandas as pd
+    if isinstance(run_dirs, str):
+        run_dirs = [run_dirs]
+
+    frames = []
+    for pattern in run_dirs:
+        for run_dir in sorted(glob.glob(pattern)):
+            if os.path.exists(os.path.join(run_dir, filename)):
+                frame = pd.read_csv(os.path.join(run_dir, filename))
+            elif os.path.exists(os.path.join(run_dir, legacy_filename)):
+                frame = read_error_file(os.path.join(run_dir, legacy_filename))
+            else:
+                continue
+            frame.insert(0, 'run', run_dir)
+            frames.append(frame)
+
+    if not frames:
+        return pd.DataFrame(columns=['run'] + BASE_COLUMNS)
+    return pd.concat(frames, ignore_index=True, sort=False)
+
+def latest_metrics(run_dirs, filename='metrics.csv', legacy_filename='error_file.txt'):
+    """ The last logged epoch of every run """
+    return read_metrics(run_dirs, filename, legacy_filename).groupby('run', sort=False).tail(1).set_index('run')
+
+if __name__ == "__main__":
+    # python Metrics.py 'runs/dice_generic/*/*' ... prints the current losses of all matching runs
+    import pandas as pd
+    with pd.option_context('display.max_rows', None, 'display.max_columns', None, 'display.width', None):
+        print(latest_metrics(sys.argv[1:]))
@@ -7,10 +7,17 @@ Created on Tue Apr 28 09:07:14 2020
 """
 
 import tensorflow as tf
+import contextlib
 import hydra
+import json
 import os
 import sys
 import shutil
+import Constants
+import Ensemble
+import Profiling
+import Schedules
+import WarmStart
 from omegaconf import OmegaConf
 
 import Globals
@@ -22,6 +29,17 @@ if os.getenv('OMPI_COMM_WORLD_SIZE'):
 else:
     setattr(sys.modules[__name__], "horovod", False)
 
+# local data-parallel training (see run_parallel.py), the workers find each other through TF_CONFIG
+if os.getenv('DEQN_LOCAL_WORKERS') and not horovod:
+    setattr(sys.modules[__name__], "local_parallel", True)
+else:
+    setattr(sys.modules[__name__], "local_parallel", False)
+
+# processes that share the machine (run_parallel.py, sweep.py) are limited to the cores they are pinned to
+if os.getenv('DEQN_THREADS_PER_WORKER'):
+    tf.config.threading.set_intra_op_parallelism_threads(int(os.getenv('DEQN_THREADS_PER_WORKER')))
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
 
 if "USE_CONFIG_FROM_RUN_DIR" in os.environ.keys():
     conf = OmegaConf.load(os.environ["USE_CONFIG_FROM_RUN_DIR"] + "/.hydra/config.yaml")
@@ -38,10 +56,18 @@ if "USE_CONFIG_FROM_RUN_DIR" in os.environ.keys():
     conf_new = OmegaConf.create(conf_dict)
     OmegaConf.save(config=conf_new, f="config_postprocess/config.yaml")
 
+# subdirectories of the run directory written by the training itself (profiler traces, exported ensemble members),
+# only these are removed together with the checkpoints and event files when a NEW run starts
+RUN_ARTIFACT_DIRS = ["plugins", "members"]
+
 #### Configuration setup
 @hydra.main(config_path=("config_postprocess" if "USE_CONFIG_FROM_RUN_DIR" in os.environ.keys() else "config"), config_name="config.yaml")
 def set_conf(cfg):
+    # startup phases (see Profiling.py)
+    Profiling.startup.mark("config")
     print(OmegaConf.to_yaml(cfg))
+    setattr(sys.modules[__name__], "config", OmegaConf.to_container(cfg))
+    Profiling.startup.mark("config print")
     
     # debug
     if cfg.get("enable_check_numerics"):
@@ -52,7 +78,10 @@ def set_conf(cfg):
     setattr(sys.modules[__name__],"MODEL_NAME", cfg.MODEL_NAME)
     
     seed_offset = 0
+    num_workers = 1
+    strategy = None
     
+    # horovod_worker is set for every worker but the first one (rank 0), which alone does the checkpointing and logging
     setattr(sys.modules[__name__], "horovod_worker", False)
     
     # distributed setup
@@ -67,9 +96,25 @@ def set_conf(cfg):
             tf.config.experimental.set_visible_devices(gpus[hvd.local_rank()], 'GPU')
         
         seed_offset = hvd.rank()
+        num_workers = hvd.size()
         if seed_offset > 0:
             setattr(sys.modules[__name__], "horovod_worker", True)
     
+    if local_parallel:
+        # one replica per process, gradients are averaged with collective all-reduce over the local workers
+        if hasattr(tf.distribute, 'MultiWorkerMirroredStrategy'):
+            strategy = tf.distribute.MultiWorkerMirroredStrategy()
+        else:
+            strategy = tf.distribute.experimental.MultiWorkerMirroredStrategy()
+        seed_offset = json.loads(os.environ['TF_CONFIG'])['task']['index']
+        num_workers = strategy.num_replicas_in_sync
+        if seed_offset > 0:
+            setattr(sys.modules[__name__], "horovod_worker", True)
+        print("Local data-parallel worker " + str(seed_offset) + " of " + str(num_workers))
+    
+    setattr(sys.modules[__name__], "strategy", strategy)
+    setattr(sys.modules[__name__], "num_workers", num_workers)
+    
     # RNG       
     tf.random.set_seed(cfg.seed + seed_offset)
     rng_state = tf.Variable([0, 0, cfg.seed + seed_offset], dtype=tf.int64)
@@ -83,11 +128,47 @@ def set_conf(cfg):
     setattr(sys.modules[__name__], "N_episodes", cfg.run.N_episodes)
     setattr(sys.modules[__name__], "expectation_pseudo_draws", cfg.run.get('expectation_pseudo_draws',5))
     setattr(sys.modules[__name__], "expectation_type", cfg.run.get('expectation_type','product'))
+    setattr(sys.modules[__name__], "quadrature_level", cfg.run.get('quadrature_level',3))
+    setattr(sys.modules[__name__], "quadrature_cache_dir", cfg.run.get('quadrature_cache_dir', os.path.join(hydra.utils.get_original_cwd(), 'quadrature_cache')))
     setattr(sys.modules[__name__], "sorted_within_batch", cfg.run.get('sorted_within_batch',False))
+    setattr(sys.modules[__name__], "xla_compile", cfg.run.get('xla_compile',False))
+    # RETRACING (see Compile.py), traces per function before a warning (an error with strict_tracing)
+    setattr(sys.modules[__name__], "trace_budget", cfg.run.get('trace_budget',None))
+    setattr(sys.modules[__name__], "strict_tracing", cfg.run.get('strict_tracing',False))
+    # REPLAY BUFFER (see Replay.py), 0 trains on the last episode only
+    setattr(sys.modules[__name__], "replay_buffer_size", cfg.run.get('replay_buffer_size',0))
+    setattr(sys.modules[__name__], "replay_alpha", cfg.run.get('replay_alpha',0.6))
+    setattr(sys.modules[__name__], "replay_min_priority", cfg.run.get('replay_min_priority',1e-8))
+    setattr(sys.modules[__name__], "replay_refresh_every", cfg.run.get('replay_refresh_every',0))
+    if replay_buffer_size and horovod:
+        print("WARNING: the replay buffer is not used with Horovod, every epoch trains on the last episode!")
+    elif replay_buffer_size and num_workers > 1:
+        print("Replay buffer per worker: each of the " + str(num_workers) + " workers keeps and samples the states it simulated, the gradients are averaged")
+    # CONVERGENCE (see Convergence.py), without tolerance or patience all N_episodes are run
+    setattr(sys.modules[__name__], "convergence_smoothing", cfg.run.get('convergence_smoothing',0.9))
+    setattr(sys.modules[__name__], "convergence_tolerance", cfg.run.get('convergence_tolerance',None))
+    setattr(sys.modules[__name__], "convergence_equation_tolerance", cfg.run.get('convergence_equation_tolerance',None))
+    setattr(sys.modules[__name__], "convergence_patience", cfg.run.get('convergence_patience',None))
+    setattr(sys.modules[__name__], "convergence_min_delta", cfg.run.get('convergence_min_delta',0.01))
+    setattr(sys.modules[__name__], "convergence_min_episodes", cfg.run.get('convergence_min_episodes',100))
     if sorted_within_batch and N_episode_length < N_minibatch_size:
         print("WARNING: minibatch size is larger than the episode length and sorted batches were requested!")
-    # OUTPUT FILE FOR ERROR MEASURES
-    setattr(sys.modules[__name__], "error_filename", cfg.error_filename)
+    # METRICS LOG (CSV, see Metrics.py)
+    setattr(sys.modules[__name__], "metrics_filename", cfg.get("metrics_filename", "metrics.csv"))
+    setattr(sys.modules[__name__], "metrics_flush_every", cfg.get("metrics_flush_every", 10))
+    # TENSORBOARD SUMMARIES (see Summaries.py)
+    setattr(sys.modules[__name__], "summary_every_steps", cfg.get("summary_every_steps", 1))
+    setattr(sys.modules[__name__], "summary_every_seconds", cfg.get("summary_every_seconds", 0))
+    setattr(sys.modules[__name__], "summary_aggregate", cfg.get("summary_aggregate", False))
+    # PHASE TIMINGS AND PROFILER (see Profiling.py)
+    setattr(sys.modules[__name__], "timings_filename", cfg.get("timings_filename", "timings.csv"))
+    setattr(sys.modules[__name__], "profile_episodes", cfg.run.get('profile_episodes', None))
+    # PERSISTENT GRAPH CACHE (see GraphCache.py), relative to the launch directory
+    setattr(sys.modules[__name__], "graph_cache_dir", os.path.join(hydra.utils.get_original_cwd(), cfg.GRAPH_CACHE) if cfg.get("GRAPH_CACHE", None) else None)
+    # BENCHMARK (see benchmark.py)
+    setattr(sys.modules[__name__], "seed", cfg.seed)
+    setattr(sys.modules[__name__], "benchmark_micro", cfg.run.get('benchmark_micro', True))
+    setattr(sys.modules[__name__], "benchmark_repeats", cfg.run.get('benchmark_repeats', 10))
    
 
     # VARIABLES
@@ -108,6 +189,19 @@ def set_conf(cfg):
         config_policies = cfg.variables.policies
         config_definitions = cfg.variables.definitions
         config_constants = cfg.constants.constants
+    
+    # ENSEMBLE of parameterizations trained together (see Ensemble.py), given by the names of their constants configs
+    ensemble_names = list(cfg.run.get('ensemble', None) or [])
+    ensemble_size = max(len(ensemble_names), 1)
+    ensemble_constants = None
+    if ensemble_names:
+        ensemble_constants = Ensemble.member_constants(ensemble_names, os.path.join(os.path.dirname(os.path.abspath(__file__)), "config"))
+        config_constants = Ensemble.stack_constants(ensemble_constants)
+        print("Ensemble of " + str(ensemble_size) + " members: " + ", ".join(ensemble_names))
+    setattr(sys.modules[__name__], "ensemble", len(ensemble_names) > 0)
+    setattr(sys.modules[__name__], "ensemble_names", ensemble_names)
+    setattr(sys.modules[__name__], "ensemble_size", ensemble_size)
+    setattr(sys.modules[__name__], "ensemble_constants", ensemble_constants)
         
     setattr(sys.modules[__name__], "states", [s['name'] for s in config_states])
     setattr(sys.modules[__name__], "policy_states", [s['name'] for s in config_policies])
@@ -180,39 +274,114 @@ def set_conf(cfg):
     
     
     # NEURAL NET
-    tf.keras.backend.set_floatx(cfg.run.get('keras_precision','float32'))
+    keras_precision = cfg.run.get('keras_precision','float32')
+    if keras_precision == 'bfloat16':
+        # the network computes in bfloat16, while the weights (and thus the optimizer) are kept in float32
+        tf.keras.backend.set_floatx('float32')
+        if hasattr(tf.keras.mixed_precision, 'set_global_policy'):
+            tf.keras.mixed_precision.set_global_policy('mixed_bfloat16')
+        else:
+            tf.keras.mixed_precision.experimental.set_policy('mixed_bfloat16')
+    else:
+        tf.keras.backend.set_floatx(keras_precision)
+    setattr(sys.modules[__name__], "keras_precision", keras_precision)
     
-    layers = []
+    # the network and optimizer variables are mirrored over the workers in local data-parallel mode
+    distribution_scope = strategy.scope() if strategy is not None else contextlib.nullcontext()
+    with distribution_scope:
+        layers = []
 
-    for i, layer in enumerate(cfg.net.layers, start=1):
-        if i < len(cfg.net.layers):
-            if 'dropout_rate' in layer['hidden']:
-                layers.append(tf.keras.layers.Dropout(rate=layer['hidden']['dropout_rate']))
-            if 'batch_normalize' in layer['hidden']:
-                layers.append(tf.keras.layers.BatchNormalization(**layer['hidden']['batch_normalize']))    
-            layers.append(tf.keras.layers.Dense(units = layer['hidden']['units'], activation = layer['hidden']['activation'], kernel_initializer=tf.keras.initializers.VarianceScaling(scale=layer['hidden'].get('init_scale',1.0), mode=cfg.net.get('net_initializer_mode','fan_in'), distribution=cfg.net.get('net_initializer_distribution','truncated_normal'), seed=i)))
-        else: 
-            layers.append(tf.keras.layers.Dense(units = len(policy_states), activation = layer['output']['activation'], kernel_initializer=tf.keras.initializers.VarianceScaling(scale=layer['output'].get('init_scale',1.0), mode=cfg.net.get('net_initializer_mode','fan_in'), distribution=cfg.net.get('net_initializer_distribution','truncated_normal'), seed=i)))
+        # in an ensemble every dense layer holds the weights of all members
+        dense_layer = (lambda **kwargs: Ensemble.EnsembleDense(ensemble_size, **kwargs)) if ensemble else tf.keras.layers.Dense
+        for i, layer in enumerate(cfg.net.layers, start=1):
+            if i < len(cfg.net.layers):
+                if 'dropout_rate' in layer['hidden']:
+                    layers.append(tf.keras.layers.Dropout(rate=layer['hidden']['dropout_rate']))
+                if 'batch_normalize' in layer['hidden']:
+                    if ensemble:
+                        raise ValueError("Batch normalization would mix the members of an ensemble, remove batch_normalize from the net config.")
+                    layers.append(tf.keras.layers.BatchNormalization(**layer['hidden']['batch_normalize']))    
+                layers.append(dense_layer(units = layer['hidden']['units'], activation = layer['hidden']['activation'], kernel_initializer=tf.keras.initializers.VarianceScaling(scale=layer['hidden'].get('init_scale',1.0), mode=cfg.net.get('net_initializer_mode','fan_in'), distribution=cfg.net.get('net_initializer_distribution','truncated_normal'), seed=i)))
+            else: 
+                layers.append(dense_layer(units = len(policy_states), activation = layer['output']['activation'], kernel_initializer=tf.keras.initializers.VarianceScaling(scale=layer['output'].get('init_scale',1.0), mode=cfg.net.get('net_initializer_mode','fan_in'), distribution=cfg.net.get('net_initializer_distribution','truncated_normal'), seed=i)))
              
-    policy_net = tf.keras.models.Sequential(layers)
-    policy_net.build(input_shape=(None,len(states)))
+        policy_net = tf.keras.models.Sequential(layers)
+        policy_net.build(input_shape=(ensemble_size, None, len(states)) if ensemble else (None,len(states)))
     
-    learning_rate_multiplier = 1 if not horovod else hvd.size()
+        learning_rate_multiplier = num_workers
+        
+        # warmup, decay and plateau reduction of the learning rate (see Schedules.py)
+        learning_rate = cfg.optimizer.learning_rate * learning_rate_multiplier
+        lr_plateau_reduction = None
+        if cfg.optimizer.get('lr_schedule', None) is not None:
+            learning_rate, lr_plateau_reduction = Schedules.from_config(learning_rate, OmegaConf.to_container(cfg.optimizer.lr_schedule))
+    
+        # loss scaling can be 'dynamic' or a fixed scale
+        loss_scale = cfg.optimizer.get('loss_scale', None)
+        # the LossScaleOptimizer does not accept an optimizer with clipvalue, the unscaled gradients are clipped in loss_and_gradients instead
+        gradient_clipvalue = cfg.optimizer.get('clipvalue', None) if loss_scale is not None else None
+        if loss_scale is None:
+            optim = getattr(tf.keras.optimizers,cfg.optimizer.optimizer)(learning_rate=learning_rate, clipvalue=cfg.optimizer.clipvalue)
+        else:
+            optim = getattr(tf.keras.optimizers,cfg.optimizer.optimizer)(learning_rate=learning_rate)
+        if loss_scale is not None:
+            if hasattr(tf.keras.mixed_precision, 'LossScaleOptimizer'):
+                if loss_scale == 'dynamic':
+                    optim = tf.keras.mixed_precision.LossScaleOptimizer(optim)
+                else:
+                    optim = tf.keras.mixed_precision.LossScaleOptimizer(optim, dynamic=False, initial_scale=loss_scale)
+            else:
+                optim = tf.keras.mixed_precision.experimental.LossScaleOptimizer(optim, loss_scale=loss_scale)
+    setattr(sys.modules[__name__], "loss_scaling", loss_scale is not None)
+    setattr(sys.modules[__name__], "gradient_clipvalue", gradient_clipvalue)
+    setattr(sys.modules[__name__], "lr_plateau_reduction", lr_plateau_reduction)
     
-    optim = getattr(tf.keras.optimizers,cfg.optimizer.optimizer)(learning_rate=cfg.optimizer.learning_rate * learning_rate_multiplier, clipvalue=cfg.optimizer.clipvalue)
+    # progressive growth of the minibatch (see Schedules.py), the stage is checkpointed
+    minibatch_stage = tf.Variable(0, dtype=tf.int64, trainable=False)
+    minibatch_loss_level = tf.Variable(0, dtype=tf.int64, trainable=False)
+    minibatch_growth = Schedules.MinibatchGrowth(N_minibatch_size, minibatch_stage, minibatch_loss_level, cfg.run.get('minibatch_growth_factor', None),
+                                                 cfg.run.get('minibatch_growth_every', None), cfg.run.get('minibatch_growth_losses', None), cfg.run.get('N_minibatch_size_max', None),
+                                                 N_episode_length * N_sim_batch)
+    setattr(sys.modules[__name__], "minibatch_growth", minibatch_growth)
             
     # apply post-processing per-variable
+    # the output columns are grouped by activation once at config time, so each forward pass applies every
+    # activation to all of its columns at once and restores the original column order with a single gather
+    activation_groups = {}
+    identity_columns = []
+    implied_columns, implied_lower, implied_upper = [], [], []
+    for i, pol in enumerate(config_policies):
+        if 'activation' not in pol.keys():
+            identity_columns.append(i)
+        elif pol['activation'] == 'implied':
+            if not ('bounds' in pol.keys() and 'lower' in pol['bounds'].keys() and 'upper' in pol['bounds'].keys()):
+                raise ValueError("Policy " + pol['name'] + " uses an implied activation, which needs both a lower and an upper bound.")
+            implied_columns.append(i)
+            implied_lower.append(pol['bounds']['lower'])
+            implied_upper.append(pol['bounds']['upper'])
+        else:
+            activation_groups.setdefault(pol['activation'], []).append(i)
+    
+    # the output head always runs in the float type of the weights (the bfloat16 network output is cast back to float32)
+    policy_dtype = tf.keras.backend.floatx()
+    policy_output_groups = [(eval(activation_str), columns) for activation_str, columns in activation_groups.items()]
+    if implied_columns:
+        implied_lower = tf.constant(implied_lower, dtype=policy_dtype)
+        implied_range = tf.constant(implied_upper, dtype=policy_dtype) - implied_lower
+        policy_output_groups.append((lambda x: implied_lower + implied_range * tf.math.sigmoid(x), implied_columns))
+    if identity_columns:
+        policy_output_groups.append((lambda x: x, identity_columns))
+    
+    output_columns = [i for _, columns in policy_output_groups for i in columns]
+    output_order = tf.constant([output_columns.index(i) for i in range(len(config_policies))])
+    
     def policy(s):
-        raw_policy = policy_net(s)
-        for i, pol in enumerate(config_policies):
-            if 'activation' in pol.keys():
-                activation_str = pol['activation']
-                if pol['activation'] == 'implied':
-                    if 'lower' in pol['bounds'].keys() and 'upper' in pol['bounds'].keys():
-                        activation_str = 'lambda x: {l} + ({u} - {l}) * tf.math.sigmoid(x)'.format(l=str(pol['bounds']['lower']), u=str(pol['bounds']['upper']))
-                raw_policy = tf.tensor_scatter_nd_update(raw_policy,[[j,i] for j in range(s.shape[0])],eval(activation_str)(raw_policy[:,i]))        
+        raw_policy = tf.cast(Ensemble.apply(policy_net, s, ensemble_size) if ensemble else policy_net(s), policy_dtype)
+        raw_policy = tf.gather(
+            tf.concat([activation(tf.gather(raw_policy, columns, axis=-1)) for activation, columns in policy_output_groups], axis=-1),
+            output_order, axis=-1)
                             
-        if cfg.run.keras_precision == 'float64':
+        if keras_precision == 'float64':
             return tf.cast(raw_policy, tf.dtypes.float32)
         
         return raw_policy
@@ -220,15 +389,19 @@ def set_conf(cfg):
     setattr(sys.modules[__name__], "policy", policy)
     setattr(sys.modules[__name__], "policy_net", policy_net)
     
+    Profiling.startup.mark("network")
+
     # OPTIMIZER
     setattr(sys.modules[__name__], "optimizer", optim)
        
-    # CONSTANTS
-    for (key, value) in config_constants.items():
+    # CONSTANTS, held as variables in a parameter store, so they can be changed without retracing (see Constants.py)
+    constants = Constants.ParameterStore(config_constants)
+    for (key, value) in constants.items():
         setattr(sys.modules[__name__], key, value)
+    setattr(sys.modules[__name__], "constants", constants)
 
     # STATE INITIALIZATION
-    def initialize_states(N_batch = N_sim_batch):    
+    def initialize_member_states(N_batch):
         # starting state
         init_val = tf.ones([N_batch, len(states)])
         # apply special inits if any
@@ -236,6 +409,12 @@ def set_conf(cfg):
             if 'init' in s:
                 init_val = tf.tensor_scatter_nd_update(init_val, [[j,i] for j in range(init_val.shape[0])], getattr(rng,s["init"]["distribution"])(shape=(N_batch,), **s["init"]["kwargs"]))
         return init_val
+    
+    def initialize_states(N_batch = N_sim_batch):
+        # an ensemble draws the starting states of every member, [K, N_batch, n_states]
+        if ensemble:
+            return tf.stack([initialize_member_states(N_batch) for _ in range(ensemble_size)])
+        return initialize_member_states(N_batch)
 
     starting_state = tf.Variable(initialize_states())
     
@@ -251,22 +430,37 @@ def set_conf(cfg):
     if cfg.STARTING_POINT == 'NEW' and not horovod_worker:
         for file in os.scandir(os.getcwd()):
             if not ".hydra" in file.path:
-                os.unlink(file.path)
+                if not file.is_dir(follow_symlinks=False):
+                    os.unlink(file.path)
+                elif file.name in RUN_ARTIFACT_DIRS:
+                    shutil.rmtree(file.path)
             
-    setattr(sys.modules[__name__], "writer", tf.summary.create_file_writer(os.getcwd()))
+    setattr(sys.modules[__name__], "writer", tf.summary.create_file_writer(os.getcwd()) if not horovod_worker else tf.summary.create_noop_writer())
     
     setattr(sys.modules[__name__], "current_episode", tf.Variable(1))
-    ckpt = tf.train.Checkpoint(step=tf.Variable(1), current_episode=current_episode, optimizer=optimizer, policy=policy_net, rng_state = rng_state, starting_state=starting_state)
+    checkpointed = dict(step=tf.Variable(1), current_episode=current_episode, optimizer=optimizer, policy=policy_net, rng_state = rng_state, starting_state=starting_state,
+                        minibatch_stage=minibatch_stage, minibatch_loss_level=minibatch_loss_level)
+    if lr_plateau_reduction is not None:
+        checkpointed['lr_scale'] = lr_plateau_reduction.scale
+        checkpointed['lr_best_loss'] = lr_plateau_reduction.best_loss
+        checkpointed['lr_episodes_without_improvement'] = lr_plateau_reduction.episodes_without_improvement
+    ckpt = tf.train.Checkpoint(**checkpointed)
+    # write checkpoints in the background (see Checkpointing.py)
+    setattr(sys.modules[__name__], "async_checkpoint", cfg.get("ASYNC_CHECKPOINT", True))
     manager = tf.train.CheckpointManager(ckpt, os.getcwd(), max_to_keep=cfg.MAX_TO_KEEP_NUMBER, step_counter = current_episode, checkpoint_interval=cfg.CHECKPOINT_INTERVAL)
     
+    Profiling.startup.mark("optimizer and states")
     if cfg.STARTING_POINT == 'LATEST' and manager.latest_checkpoint:
         print("Restored from {}".format(manager.latest_checkpoint))
         ckpt.restore(manager.latest_checkpoint)
-         
-    if cfg.STARTING_POINT != 'LATEST' and cfg.STARTING_POINT != 'NEW':
+    elif cfg.STARTING_POINT != 'LATEST' and cfg.STARTING_POINT != 'NEW':
         print("Restored from {}".format(cfg.STARTING_POINT))
         ckpt.restore(cfg.STARTING_POINT)
-    
+    elif cfg.get("WARM_START", None):
+        # a fresh run starts from the policy network of another run (see WarmStart.py), relative paths are relative to the launch directory
+        warm_start_source = os.path.join(hydra.utils.get_original_cwd(), cfg.WARM_START)
+        WarmStart.warm_start(warm_start_source, policy_net, optimizer, states, policy_states, cfg.get("WARM_START_RESET_OPTIMIZER", True))
+    Profiling.startup.mark("checkpoint restore")
     
     setattr(sys.modules[__name__], "optimizer_starting_iteration", optimizer.iterations.numpy())
     setattr(sys.modules[__name__], "ckpt", ckpt)
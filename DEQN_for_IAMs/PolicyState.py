@@ -13,13 +13,18 @@ from Parameters import policy_states, policy_bounds_hard, policy
 for i,policy_state in enumerate(policy_states):
     if (policy_state in policy_bounds_hard['lower']) or (policy_state in policy_bounds_hard['upper']):
         setattr(sys.modules[__name__],policy_state, 
-                (lambda ind: lambda x: tf.clip_by_value(x[:,ind], policy_bounds_hard['lower'].get(policy_states[ind], np.NINF), policy_bounds_hard['upper'].get(policy_states[ind],np.Inf)))(i)
+                (lambda ind: lambda x: tf.clip_by_value(x[...,ind], policy_bounds_hard['lower'].get(policy_states[ind], np.NINF), policy_bounds_hard['upper'].get(policy_states[ind],np.Inf)))(i)
+                )
+        # bounded and raw value from a single slice - this is used for penalties
+        setattr(sys.modules[__name__],policy_state + "_AND_RAW", 
+                (lambda ind: lambda x: (lambda raw: (tf.clip_by_value(raw, policy_bounds_hard['lower'].get(policy_states[ind], np.NINF), policy_bounds_hard['upper'].get(policy_states[ind],np.Inf)), raw))(x[...,ind]))(i)
                 )
     else:
-        setattr(sys.modules[__name__],policy_state, (lambda ind: lambda x: x[:,ind])(i))
+        setattr(sys.modules[__name__],policy_state, (lambda ind: lambda x: x[...,ind])(i))
+        setattr(sys.modules[__name__],policy_state + "_AND_RAW", (lambda ind: lambda x: (lambda raw: (raw, raw))(x[...,ind]))(i))
         
     # always add a 'raw' attribute as well - this can be used for penalties
-    setattr(sys.modules[__name__],policy_state + "_RAW", (lambda ind: lambda x: x[:,ind])(i))
+    setattr(sys.modules[__name__],policy_state + "_RAW", (lambda ind: lambda x: x[...,ind])(i))
 
     # policy functions (where policy_state is explicitly calculated from current state using current policy)
-    setattr(sys.modules[__name__],policy_state + "_POLICY_FROM_STATE", (lambda ind: lambda state: policy(state)[:,ind])(i))
\ No newline at end of file
+    setattr(sys.modules[__name__],policy_state + "_POLICY_FROM_STATE", (lambda ind: lambda state: policy(state)[...,ind])(i))
@@ -0,0 +1,111 @@
+# Phase timers of the training loop and of the startup, and tf.profiler capture windows
+
+import contextlib
+import json
+import os
+import time
+import tensorflow as tf
+
+"""
+Overview:
+    - PhaseTimers accumulates the wall time of named phases (simulation, epochs, checkpoint, hooks, gc, ...) of an episode,
+      with timers.phase("simulation"): ..., end_episode() returns the seconds of every phase and the total of the episode
+    - the times are host wall times: work the device has not finished yet is counted in the phase that waits for it
+    - ProfilerWindow captures a tf.profiler trace of the episodes first to last (inclusive), written to
+      <log_dir>/plugins/profile, where TensorBoard (Profile tab) finds it when opened on the run directory
+    - startup.mark(name) ends the startup phase name (started at the previous mark), the first phase is the time from the
+      start of the process to the import of this module (python and tensorflow imports, known on Linux only)
+"""
+
+class PhaseTimers:
+    def __init__(self, phases):
+        self.phases = list(phases)
+        self.reset()
+
+    def reset(self):
+        self.seconds = {p: 0.0 for p in self.phases}
+        self.episode_start = time.perf_counter()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start
+
+    def end_episode(self):
+        """ Seconds of every phase of the episode, 'other' is the time outside of all phases """
+        total = time.perf_counter() - self.episode_start
+        seconds = dict(self.seconds)
+        seconds['other'] = max(total - sum(self.seconds.values()), 0.0)
+        seconds['total'] = total
+        self.reset()
+        return seconds
+
+def process_start_time():
+    """ Wall clock time the process was started, None if it is not known (Linux only): the start time of the process after
+    boot (field 22 of /proc/self/stat, in clock ticks) against the time since boot (/proc/uptime, to 10ms, while btime in
+    /proc/stat is truncated to whole seconds) """
+    try:
+        with open("/proc/uptime") as f:
+            now, uptime = time.time(), float(f.read().split()[0])
+        with open("/proc/self/stat") as f:
+            # the fields after the command name, which is in parentheses and may contain spaces, start with field 3
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        return now - uptime + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+class StartupReport:
+    def __init__(self):
+        self.last = time.time()
+        self.start = process_start_time() or self.last
+        self.seconds = {}
+        if self.start < self.last:
+            self.seconds['imports'] = self.last - self.start
+
+    def mark(self, name):
+        """ Ends the phase name, which started at the previous mark """
+        now = time.time()
+        self.seconds[name] = self.seconds.get(name, 0.0) + now - self.last
+        self.last = now
+
+    def report(self):
+        return dict(self.seconds, total=self.last - self.start)
+
+    def print_report(self):
+        print("Startup:")
+        for name, seconds in self.report().items():
+            print("  {:<24} {:8.2f}s".format(name, seconds))
+
+    def write_report(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+startup = StartupReport()
+
+class ProfilerWindow:
+    def __init__(self, log_dir, episodes=None, enabled=True):
+        self.log_dir = log_dir
+        self.first, self.last = (int(episodes[0]), int(episodes[1])) if episodes else (None, None)
+        self.enabled = enabled and episodes is not None
+        self.active = False
+
+    def start_episode(self, episode):
+        if self.enabled and not self.active and self.first <= episode <= self.last:
+            print("Profiling episodes " + str(episode) + " to " + str(self.last))
+            tf.profiler.experimental.start(self.log_dir)
+            self.active = True
+
+    def end_episode(self, episode):
+        if self.active and episode >= self.last:
+            self.stop()
+
+    def stop(self):
+        if self.active:
+            tf.profiler.experimental.stop()
+            self.active = False
+            # only one window per run
+            self.enabled = False
+            print("Profiler trace written to " + self.log_dir + "/plugins/profile")
@@ -0,0 +1,94 @@
+# Quadrature rules for the conditional expectation operator
+
+import itertools
+import math
+import os
+import numpy as np
+import tensorflow as tf
+from Parameters import expectation_type, quadrature_level, quadrature_cache_dir
+
+"""
+Overview:
+    - all rules integrate over independent standard normal shocks and are scaled per dimension afterwards
+    - nodes are the rows of shock_values, weights are the shock_probs (as used by Dynamics and State.E_t_gen)
+    - standardized nodes and weights are cached on disk per rule, dimension and level
+"""
+
+def gauss_hermite_1d(n):
+    """ n-point Gauss-Hermite rule for a standard normal variable """
+    x, w = np.polynomial.hermite.hermgauss(n)
+    return x * math.sqrt(2.0), w / math.sqrt(math.pi)
+
+def monomial_nodes(d, level=None):
+    """ Monomial rule with 2*d nodes (exact for polynomials up to degree 3) """
+    nodes = np.concatenate((np.eye(d) * math.sqrt(d / 2.0), np.eye(d) * -math.sqrt(d / 2.0)))
+    weights = np.full(2 * d, 1.0 / (2 * d))
+    return nodes, weights
+
+def gauss_hermite_nodes(d, level):
+    """ Tensor product of level-point Gauss-Hermite rules (level**d nodes) """
+    x, w = gauss_hermite_1d(level)
+    nodes = np.array(list(itertools.product(x, repeat=d)))
+    weights = np.prod(np.array(list(itertools.product(w, repeat=d))), axis=1)
+    return nodes, weights
+
+def smolyak_nodes(d, level):
+    """ Smolyak sparse grid built from (2i-1)-point Gauss-Hermite rules with the combination technique.
+    Level 1 is the single node at the mean, every further level adds accuracy with far fewer nodes than the product rule. """
+    q = d + level - 1
+    nodes_weights = {}
+    for index in itertools.product(range(1, level + 1), repeat=d):
+        k = sum(index)
+        if k < max(d, q - d + 1) or k > q:
+            continue
+        coefficient = (-1) ** (q - k) * math.factorial(d - 1) // (math.factorial(q - k) * math.factorial(d - 1 - (q - k)))
+        rules = [list(zip(*gauss_hermite_1d(2 * i - 1))) for i in index]
+        for point in itertools.product(*rules):
+            node = tuple(round(x, 12) for x, _ in point)
+            nodes_weights[node] = nodes_weights.get(node, 0.0) + coefficient * np.prod([w for _, w in point])
+
+    # nodes shared by several tensor grids can cancel out
+    nodes_weights = {node: weight for node, weight in nodes_weights.items() if abs(weight) > 1e-14}
+    return np.array(list(nodes_weights.keys())), np.array(list(nodes_weights.values()))
+
+rules = {
+    'monomial': monomial_nodes,
+    'product': gauss_hermite_nodes,
+    'gauss_hermite': gauss_hermite_nodes,
+    'smolyak': smolyak_nodes
+}
+
+# names of the same rule, normalized before the cache key is built so they share one cache file
+aliases = {'product': 'gauss_hermite'}
+
+def standard_nodes(rule, d, level):
+    """ Standardized nodes and weights of the given rule, loaded from the on-disk cache if they were computed before """
+    rule = aliases.get(rule, rule)
+    filename = os.path.join(quadrature_cache_dir, "{r}_d{d}_l{l}.npz".format(r=rule, d=d, l=level))
+    if os.path.exists(filename):
+        cached = np.load(filename)
+        return cached['nodes'], cached['weights']
+
+    nodes, weights = rules[rule](d, level)
+    os.makedirs(quadrature_cache_dir, exist_ok=True)
+    # write to a temporary file first, so concurrent runs never read a partial file
+    tmp_filename = filename + "." + str(os.getpid()) + ".tmp"
+    with open(tmp_filename, 'wb') as f:
+        np.savez(f, nodes=nodes, weights=weights)
+    os.replace(tmp_filename, filename)
+    return nodes, weights
+
+def quadrature_rule(scale_list, rule=None, level=None):
+    """ Returns (shock_values, shock_probs) as constant tensors for independent normal shocks with standard deviations scale_list.
+
+    The rule defaults to the configured expectation_type (monomial, gauss_hermite / product or smolyak) and the level to quadrature_level.
+    """
+    rule = rule or (expectation_type if expectation_type in rules else 'gauss_hermite')
+    level = level or quadrature_level
+    nodes, weights = standard_nodes(rule, len(scale_list), level)
+    shock_values = tf.constant(nodes * np.array(scale_list), dtype=tf.dtypes.float32)
+    shock_probs = tf.constant(weights, dtype=tf.dtypes.float32)
+    return (shock_values, shock_probs)
+
+def monomial_rule(scale_list):
+    return quadrature_rule(scale_list, rule='monomial')
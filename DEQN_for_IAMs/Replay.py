@@ -0,0 +1,61 @@
+# Replay buffer of simulated states, sampled with priority proportional to their equation residuals
+
+import tensorflow as tf
+import Compile
+import Equilibrium
+import Parameters
+
+"""
+Overview:
+    - every simulated episode is added to a bounded ring buffer of states (the oldest states are overwritten)
+    - new states get the largest priority in the buffer, so they are drawn soon
+    - minibatches are drawn with probability proportional to priority ** replay_alpha
+    - the priority of a state is the sum of its squared equation residuals, updated whenever it is trained on and for the
+      whole buffer every replay_refresh_every episodes
+    - the buffer is not checkpointed, a restarted run refills it from the new episodes
+"""
+
+def sample_priorities(sample_losses):
+    """ Priority of every sample from the squared residuals of the equations (as filled in by Equilibrium.loss_terms) """
+    return tf.math.add_n(list(sample_losses.values()))
+
+class ReplayBuffer:
+    def __init__(self, capacity, n_states, alpha=0.6, min_priority=1e-8):
+        self.capacity = capacity
+        self.alpha = alpha
+        self.min_priority = min_priority
+        self.states = tf.Variable(tf.zeros([capacity, n_states]), trainable=False)
+        self.priorities = tf.Variable(tf.zeros([capacity]), trainable=False)
+        self.size = tf.Variable(0, trainable=False)
+        self.position = tf.Variable(0, trainable=False)
+        self.refresh = Compile.function(self.refresh_priorities, jit=False)
+
+    def add(self, new_states):
+        """ Adds a [n, n_states] batch of states with the largest priority in the buffer """
+        new_states = new_states[-self.capacity:]
+        n = tf.shape(new_states)[0]
+        indices = tf.expand_dims((self.position + tf.range(n)) % self.capacity, axis=1)
+        max_priority = tf.cond(self.size > 0, lambda: tf.math.reduce_max(self.priorities[:self.size]), lambda: tf.constant(1.0))
+        self.states.scatter_nd_update(indices, new_states)
+        self.priorities.scatter_nd_update(indices, tf.fill([n], max_priority))
+        self.position.assign((self.position + n) % self.capacity)
+        self.size.assign(tf.math.minimum(self.size + n, self.capacity))
+
+    def sample(self, n):
+        """ Indices of n states drawn with probability proportional to priority ** alpha (inverse CDF, O(n log capacity)) """
+        # min_priority is added here alone, so states with a zero residual can still be drawn
+        cdf = tf.math.cumsum((self.priorities[:self.size] + self.min_priority) ** self.alpha)
+        draws = tf.random.uniform([n], maxval=cdf[-1])
+        return tf.math.minimum(tf.searchsorted(cdf, draws, side='right'), self.size - 1)
+
+    def update(self, indices, priorities):
+        self.priorities.scatter_nd_update(tf.expand_dims(indices, axis=1), tf.cast(priorities, self.priorities.dtype))
+
+    def refresh_priorities(self, chunk_size):
+        """ Recomputes the priority of every state in the buffer, chunk_size states per policy evaluation """
+        for start in tf.range(0, self.size, chunk_size):
+            indices = tf.range(start, tf.math.minimum(start + chunk_size, self.size))
+            state_sample = tf.gather(self.states, indices)
+            sample_losses = {}
+            Equilibrium.loss_terms(state_sample, Parameters.policy(state_sample), sample_losses)
+            self.update(indices, sample_priorities(sample_losses))
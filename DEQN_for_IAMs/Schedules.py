@@ -0,0 +1,118 @@
+# Learning-rate schedules and progressive minibatch growth
+
+import math
+import tensorflow as tf
+
+"""
+Overview:
+    - LearningRateSchedule: linear warmup, followed by a constant, cosine or exponentially decaying learning rate,
+      all scaled by a variable that is reduced on plateaus of the loss
+    - PlateauReduction: multiplies that scale by plateau_factor whenever the smoothed loss has not improved for plateau_patience episodes
+    - MinibatchGrowth: grows the minibatch by a factor every given number of episodes and/or whenever the smoothed loss
+      falls below the next of a list of loss levels
+    - the state (optimizer iterations, learning-rate scale, best loss of the plateau reduction and minibatch stage) lives
+      in variables of the checkpoint, so restarted runs continue with the same learning rate and minibatch size
+"""
+
+class LearningRateSchedule(tf.keras.optimizers.schedules.LearningRateSchedule):
+    def __init__(self, learning_rate, decay='constant', warmup_steps=0, decay_steps=1, decay_rate=0.1, min_learning_rate=0.0, scale=None):
+        if decay not in ('constant', 'cosine', 'exponential'):
+            raise ValueError("Unknown learning rate decay " + str(decay) + ", use constant, cosine or exponential.")
+        self.learning_rate = learning_rate
+        self.decay = decay
+        self.warmup_steps = warmup_steps
+        self.decay_steps = decay_steps
+        self.decay_rate = decay_rate
+        self.min_learning_rate = min_learning_rate
+        self.scale = scale if scale is not None else tf.Variable(1.0, trainable=False)
+
+    def __call__(self, step):
+        step = tf.cast(step, tf.float32)
+        decay_step = tf.math.maximum(step - self.warmup_steps, 0.0)
+        if self.decay == 'cosine':
+            progress = tf.math.minimum(decay_step / self.decay_steps, 1.0)
+            learning_rate = self.min_learning_rate + (self.learning_rate - self.min_learning_rate) * 0.5 * (1.0 + tf.math.cos(math.pi * progress))
+        elif self.decay == 'exponential':
+            learning_rate = tf.math.maximum(self.learning_rate * self.decay_rate ** (decay_step / self.decay_steps), self.min_learning_rate)
+        else:
+            learning_rate = tf.constant(self.learning_rate, tf.float32)
+
+        if self.warmup_steps > 0:
+            learning_rate *= tf.math.minimum((step + 1.0) / self.warmup_steps, 1.0)
+
+        return learning_rate * tf.cast(self.scale, tf.float32)
+
+    def get_config(self):
+        return {
+            "learning_rate": self.learning_rate,
+            "decay": self.decay,
+            "warmup_steps": self.warmup_steps,
+            "decay_steps": self.decay_steps,
+            "decay_rate": self.decay_rate,
+            "min_learning_rate": self.min_learning_rate,
+        }
+
+class PlateauReduction:
+    def __init__(self, scale, patience=None, factor=0.5, min_delta=0.01, min_scale=0.0):
+        self.scale = scale
+        self.patience = patience
+        self.factor = factor
+        self.min_delta = min_delta
+        self.min_scale = min_scale
+        # the best loss and the episodes since are checkpointed with the scale, so a restarted run continues the plateau
+        self.best_loss = tf.Variable(float('inf'), dtype=tf.float64, trainable=False)
+        self.episodes_without_improvement = tf.Variable(0, dtype=tf.int64, trainable=False)
+
+    def update(self, smoothed_loss):
+        if self.patience is None or smoothed_loss is None:
+            return
+        if smoothed_loss < float(self.best_loss.numpy()) * (1 - self.min_delta):
+            self.best_loss.assign(smoothed_loss)
+            self.episodes_without_improvement.assign(0)
+            return
+
+        self.episodes_without_improvement.assign_add(1)
+        if int(self.episodes_without_improvement.numpy()) >= self.patience and float(self.scale.numpy()) * self.factor >= self.min_scale:
+            self.scale.assign(self.scale * self.factor)
+            self.episodes_without_improvement.assign(0)
+            tf.print("Loss plateau: learning rate scaled by", self.scale)
+
+class MinibatchGrowth:
+    def __init__(self, base_size, stage, loss_level, factor=None, every_episodes=None, losses=None, max_size=None, sample_count=None):
+        self.base_size = base_size
+        # number of growth steps taken and number of loss levels reached so far (both checkpointed)
+        self.stage = stage
+        self.loss_level = loss_level
+        self.factor = factor
+        self.every_episodes = every_episodes
+        self.losses = sorted(losses or [], reverse=True)
+        # the minibatch never grows beyond N_minibatch_size_max, nor beyond the samples of an episode (an epoch would have no minibatch)
+        limits = [limit for limit in (max_size, sample_count) if limit]
+        self.limit = min(limits) if limits else None
+
+    def size(self):
+        if not self.factor:
+            return self.base_size
+        size = int(self.base_size * self.factor ** int(self.stage.numpy()))
+        return min(size, self.limit) if self.limit else size
+
+    def update(self, episode, smoothed_loss):
+        """ Grows the minibatch after every every_episodes episodes and whenever the smoothed loss reaches the next loss level """
+        if not self.factor:
+            return
+        grow = bool(self.every_episodes) and episode % self.every_episodes == 0
+        level = int(self.loss_level.numpy())
+        if level < len(self.losses) and smoothed_loss is not None and smoothed_loss <= self.losses[level]:
+            self.loss_level.assign_add(1)
+            grow = True
+        if grow and (not self.limit or self.size() < self.limit):
+            self.stage.assign_add(1)
+            tf.print("Minibatch size grows to " + str(self.size()))
+
+def from_config(learning_rate, config):
+    """ The schedule for the lr_schedule entry of the optimizer config (a constant learning rate if it is not given) """
+    config = dict(config or {})
+    plateau = {k[len('plateau_'):]: config.pop(k) for k in list(config.keys()) if k.startswith('plateau_')}
+    min_scale = config.pop('min_scale', 0.0)
+    schedule = LearningRateSchedule(learning_rate, **config)
+    return schedule, PlateauReduction(schedule.scale, min_scale=min_scale, **plateau)
@@ -1,65 +1,77 @@
 # TF Module containing state variables
 
 import importlib
-import math
 import sys
 import tensorflow as tf
 import numpy as np
-from Parameters import expectation_pseudo_draws, expectation_type, MODEL_NAME, policy, states, state_bounds_hard
-
-def monomial_rule(scale_list):
-    d = len(scale_list)
-    shock_probabilities = tf.constant([1 / (2*d) ] * (2*d))
-    shock_values = tf.constant(np.concatenate((np.diag(scale_list) * math.sqrt( d / 2.0), np.diag(scale_list) * -math.sqrt( d / 2.0))), dtype=tf.dtypes.float32)
-    return (shock_values, shock_probabilities)
+import Compile
+from Parameters import ensemble, expectation_pseudo_draws, expectation_type, MODEL_NAME, policy, states, state_bounds_hard
+from Quadrature import monomial_rule, quadrature_rule
 
 Dynamics = importlib.import_module(MODEL_NAME + ".Dynamics")
 
+# policy evaluation on all expectation nodes at once
+batched_policy = Compile.function(lambda next_states: policy(next_states), name="batched_policy")
+
 for i, state in enumerate(states):
     if (state in state_bounds_hard["lower"]) or (state in state_bounds_hard["upper"]):
         setattr(
             sys.modules[__name__],
             state,
             (
-                lambda ind: lambda x: tf.clip_by_value(x[:, ind], state_bounds_hard["lower"].get(states[ind], np.NINF), state_bounds_hard["upper"].get(states[ind], np.Inf))
+                lambda ind: lambda x: tf.clip_by_value(x[..., ind], state_bounds_hard["lower"].get(states[ind], np.NINF), state_bounds_hard["upper"].get(states[ind], np.Inf))
             )(i),
         )
     else:
-        setattr(sys.modules[__name__], state, (lambda ind: lambda x: x[:, ind])(i))
+        setattr(sys.modules[__name__], state, (lambda ind: lambda x: x[..., ind])(i))
 
     # always add a 'raw' attribute as well - this can be used for penalties
-    setattr(sys.modules[__name__], state + "_RAW", (lambda ind: lambda x: x[:, ind])(i))
+    setattr(sys.modules[__name__], state + "_RAW", (lambda ind: lambda x: x[..., ind])(i))
 
 def E_t_gen(state, policy_state):
+    """ Generates the conditional expectation operator for the given state and policy.
+    
+    All shock nodes (or pseudo random draws) are stacked along a leading node axis, so the policy of every node is evaluated
+    in a single forward pass on an [n_nodes*batch, n_states] tensor. The integrands are evaluated on the stacked
+    [n_nodes, batch, ...] tensors at once and reduced with the probability weights along the node axis.
+    """
     if expectation_type != 'pseudo_random':
-        next_states = [Dynamics.total_step_spec_shock(state, policy_state, i) for i in range(len(Dynamics.shock_probs))]
-        next_policies = [policy(next_state) for next_state in next_states]
-
-        def E_t(evalFun):
-            # calculate conditional expectation
-            res = tf.zeros(state.shape[0])  
-            for i in range(len(Dynamics.shock_probs)):
-                res += Dynamics.shock_probs[i] * evalFun(next_states[i], next_policies[i])
-            return res
+        next_states = tf.stack([Dynamics.total_step_spec_shock(state, policy_state, i) for i in range(len(Dynamics.shock_probs))])
+        shock_probs = tf.convert_to_tensor(Dynamics.shock_probs)
     else:
-        next_states = [Dynamics.total_step_random(state, policy_state) for i in range(expectation_pseudo_draws)]
-        next_policies = [policy(next_state) for next_state in next_states]
-        
-        def E_t(evalFun):
-            # calculate conditional expectation
-            res = tf.zeros(state.shape[0])  
-            for i in range(expectation_pseudo_draws):
-                res += 1.0 / expectation_pseudo_draws * evalFun(next_states[i], next_policies[i])
-            return res
+        next_states = tf.stack([Dynamics.total_step_random(state, policy_state) for i in range(expectation_pseudo_draws)])
+        shock_probs = tf.fill([expectation_pseudo_draws], 1.0 / expectation_pseudo_draws)
+    
+    if ensemble:
+        # the ensemble policy keeps the member axis and flattens the node axis itself
+        next_policies = batched_policy(next_states)
+    else:
+        next_policies = batched_policy(tf.reshape(next_states, [-1, len(states)]))
+        next_policies = tf.reshape(next_policies, tf.concat([tf.shape(next_states)[:-1], tf.shape(next_policies)[-1:]], axis=0))
+    
+    def E_t(evalFun):
+        # calculate conditional expectation
+        res = tf.convert_to_tensor(evalFun(next_states, next_policies))
+        weights = tf.reshape(tf.cast(shock_probs, res.dtype), [-1] + [1] * (len(res.shape) - 1))
+        return tf.math.reduce_sum(weights * res, axis=0)
+    
     return E_t
 
+def check_states(new_vals_dict):
+    unknown = set(new_vals_dict) - set(states)
+    if unknown:
+        raise ValueError("Unknown states " + str(sorted(unknown)) + ", the states of this model are " + str(states) + ".")
+
+def stack(new_vals_dict, like):
+    """ Assembles a state matrix from a dictionary of named columns in the canonical order of states.
+    States that are not given are set to zero, like is used for the shape and dtype of these columns. """
+    check_states(new_vals_dict)
+    zeros = tf.zeros_like(like[..., 0])
+    return tf.stack([new_vals_dict.get(s, zeros) for s in states], axis=-1)
+
 def update(old_states, at, new_vals):
-    i = states.index(at)
-    return tf.tensor_scatter_nd_update(old_states,[[j,i] for j in range(old_states.shape[0])], new_vals)
+    return update_dict(old_states, {at: new_vals})
 
 def update_dict(old_states, new_vals_dict):
-    new_states = old_states
-    for s in new_vals_dict:
-        new_states = tf.tensor_scatter_nd_update(new_states,[[j,i] for j in range(new_states.shape[0])], new_vals_dict[s])
-        
-    return new_states
\ No newline at end of file
+    check_states(new_vals_dict)
+    return tf.stack([new_vals_dict.get(s, old_states[..., i]) for i, s in enumerate(states)], axis=-1)
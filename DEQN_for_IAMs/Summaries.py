@@ -0,0 +1,74 @@
+# Sampled TensorBoard summaries of the equation losses and penalties of the gradient steps
+
+import tensorflow as tf
+import Equilibrium
+from Parameters import horovod_worker, optimizer, summary_aggregate, summary_every_seconds, summary_every_steps
+
+"""
+Overview:
+    - the scalars of a gradient step are only written every summary_every_steps optimizer steps and/or once
+      summary_every_seconds have passed since the last written step (0 disables a criterion)
+    - with summary_aggregate the scalars are summed up in variables on the device and their mean since the last
+      written step is written instead of the value of the written step alone
+    - the decision is taken inside the graph with tf.summary.record_if, so the steps in between add no summary ops
+"""
+
+class SummaryScheduler:
+    def __init__(self, names, every_steps=1, every_seconds=0, aggregate=False):
+        self.every_steps = every_steps
+        self.every_seconds = every_seconds
+        self.aggregate = aggregate
+        self.last_time = tf.Variable(0.0, dtype=tf.float64, trainable=False)
+        if aggregate:
+            self.sums = {name: tf.Variable(0.0, trainable=False) for name in names}
+            self.count = tf.Variable(0.0, trainable=False)
+
+    def should_record(self, step):
+        conditions = []
+        if self.every_steps:
+            conditions.append(tf.equal(step % self.every_steps, 0))
+        if self.every_seconds:
+            conditions.append(tf.timestamp() - self.last_time >= self.every_seconds)
+        if not conditions:
+            return tf.constant(True)
+        return tf.reduce_any(tf.stack(conditions))
+
+    def reset(self):
+        ops = [self.last_time.assign(tf.timestamp())]
+        if self.aggregate:
+            ops += [s.assign(0.0) for s in self.sums.values()] + [self.count.assign(0.0)]
+        return tf.group(ops)
+
+    def write(self, scalars):
+        """ Writes the scalars of the current gradient step, if the schedule records it """
+        step = optimizer.iterations
+        record = self.should_record(step)
+
+        if self.aggregate:
+            for name, value in scalars.items():
+                self.sums[name].assign_add(tf.cast(value, tf.float32))
+            self.count.assign_add(1.0)
+            scalars = {name: self.sums[name] / self.count for name in scalars.keys()}
+
+        with tf.summary.record_if(record):
+            tf.summary.experimental.set_step(step)
+            for name, value in scalars.items():
+                tf.summary.scalar(name, value)
+
+        tf.cond(record, self.reset, tf.no_op)
+
+# the first worker alone writes summaries, the scheduler is created by init() (from Graphs.init_training_logs, outside of the
+# replica context of the gradient steps), as the names of the scalars need an evaluation of the equations, which is not done at import
+scheduler = None
+
+def init():
+    global scheduler
+    if horovod_worker or scheduler is not None:
+        return
+    scheduler = SummaryScheduler(Equilibrium.scalar_names(), summary_every_steps, summary_every_seconds, summary_aggregate)
+
+def write(scalars):
+    # gradient steps traced before init() (e.g. by benchmark.py) write no summaries
+    if scheduler is None:
+        return
+    scheduler.write(scalars)
@@ -0,0 +1,98 @@
+# Warm start of the policy network from the checkpoint of another run (e.g. a neighbouring calibration or another model)
+
+import os
+import numpy as np
+import tensorflow as tf
+from omegaconf import OmegaConf
+
+"""
+Overview:
+    - the source is a run directory (its latest checkpoint is used) or a checkpoint path
+    - with the same states and policies (and reset_optimizer False) the network and the optimizer state are restored as they are
+    - otherwise only the network weights are copied: the rows of the input layer and the columns of the output layer are matched
+      by the state and policy names in the source run's .hydra/config.yaml, inputs and outputs without a match keep their
+      initial weights (new inputs start with zero weights in the first dense layer), and the optimizer starts from scratch
+    - the weights of the layers before the first dense layer (a batch normalization: gamma, beta and the moving statistics)
+      are matched by the state names as well
+    - the hidden layers have to have the same shapes in both runs
+"""
+
+def source_checkpoint(source):
+    """ Checkpoint path and run directory of a warm start source """
+    if os.path.isdir(source):
+        checkpoint = tf.train.latest_checkpoint(source)
+        if checkpoint is None:
+            raise ValueError("No checkpoint found in the warm start directory " + source)
+        return checkpoint, source
+    return source, os.path.dirname(source)
+
+def source_variables(run_dir):
+    """ State and policy names of the source run, None if its config can not be found """
+    config_file = os.path.join(run_dir, ".hydra", "config.yaml")
+    if not os.path.exists(config_file):
+        return None, None
+    conf = OmegaConf.load(config_file)
+    # runs written with the old, flat config layout
+    variables = conf.variables if "variables" in conf else conf
+    return [s['name'] for s in variables.states], [p['name'] for p in variables.policies]
+
+def layer_weights(reader, index, weight):
+    return reader.get_tensor("policy/layer_with_weights-" + str(index) + "/" + weight + "/.ATTRIBUTES/VARIABLE_VALUE")
+
+def remap(target, source, target_names, source_names, axis, missing=None):
+    """ Copies the slices of source along axis into target, matched by name, the slices without a source are set to missing
+    (if given) or keep their value in target """
+    result = np.array(target)
+    if [d for k, d in enumerate(result.shape) if k != axis] != [d for k, d in enumerate(source.shape) if k != axis]:
+        raise ValueError("Can not warm start from a network with differently sized hidden layers: " + str(source.shape) + " in the source, " + str(result.shape) + " in this run.")
+    for i, name in enumerate(target_names):
+        if name in source_names:
+            index = [slice(None)] * result.ndim
+            index[axis] = i
+            source_index = [slice(None)] * result.ndim
+            source_index[axis] = source_names.index(name)
+            result[tuple(index)] = source[tuple(source_index)]
+        elif missing is not None:
+            index = [slice(None)] * result.ndim
+            index[axis] = i
+            result[tuple(index)] = missing
+    return result
+
+def warm_start(source, policy_net, optimizer, states, policy_states, reset_optimizer=True):
+    checkpoint, run_dir = source_checkpoint(source)
+    source_states, source_policies = source_variables(run_dir)
+    if source_states is None:
+        print("WARNING: no .hydra/config.yaml next to the warm start checkpoint, assuming the same states and policies.")
+        source_states, source_policies = list(states), list(policy_states)
+    same_variables = source_states == list(states) and source_policies == list(policy_states)
+
+    if same_variables and not reset_optimizer:
+        tf.train.Checkpoint(policy=policy_net, optimizer=optimizer).restore(checkpoint).expect_partial()
+        print("Warm start from {} (network and optimizer)".format(checkpoint))
+        return
+
+    reader = tf.train.load_checkpoint(checkpoint)
+    weighted_layers = [layer for layer in policy_net.layers if layer.weights]
+    # the layers up to the first dense layer (e.g. a batch normalization) have a weight per state, as has the kernel of the first dense layer
+    first_dense = next(index for index, layer in enumerate(weighted_layers) if hasattr(layer, 'kernel'))
+    for index, layer in enumerate(weighted_layers):
+        values = []
+        for variable in layer.weights:
+            weight = variable.name.split('/')[-1].split(':')[0]
+            value = layer_weights(reader, index, weight)
+            if index < first_dense:
+                # inputs the source network did not have keep the initial normalization
+                value = remap(variable.numpy(), value, list(states), source_states, axis=value.ndim - 1)
+            elif index == first_dense and weight == 'kernel':
+                # an input the source network did not have is ignored at first
+                value = remap(variable.numpy(), value, list(states), source_states, axis=value.ndim - 2, missing=0.0)
+            if index == len(weighted_layers) - 1:
+                value = remap(variable.numpy(), value, list(policy_states), source_policies, axis=value.ndim - 1)
+            if tuple(value.shape) != tuple(variable.shape):
+                raise ValueError("Can not warm start " + variable.name + ": shape " + str(tuple(value.shape)) + " in the source, " + str(tuple(variable.shape)) + " in this run.")
+            values.append(value)
+        layer.set_weights(values)
+
+    if not same_variables:
+        print("Warm start: inputs without a source " + str([s for s in states if s not in source_states]) + ", outputs without a source " + str([p for p in policy_states if p not in source_policies]))
+    print("Warm start from {} (network only, the optimizer starts from scratch)".format(checkpoint))
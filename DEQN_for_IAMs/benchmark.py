@@ -0,0 +1,156 @@
+"""
+Filename: benchmark.py
+Description:
+Benchmark of the training throughput and of the Euler errors reached with the current configuration.
+Every run trains for run.N_episodes full training cycles (Graphs.run_cycle) from a fresh network and appends one JSON record to
+benchmark_results.jsonl in the directory the script was started from. Compare configurations by running it
+once per configuration, e.g. float32 against bfloat16 compute (or +run.xla_compile=True against False):
+
+    python benchmark.py constants=dice_generic_mmm_mmm variables=dice_generic_mmm_mmm STARTING_POINT=NEW run.N_episodes=50 run.keras_precision=float32
+    python benchmark.py constants=dice_generic_mmm_mmm variables=dice_generic_mmm_mmm STARTING_POINT=NEW run.N_episodes=50 run.keras_precision=bfloat16
+
+After the training, the hot paths (policy forward pass, Equations.equations, State.E_t_gen, simulate_random_episode and
+run_epoch_compiled with run.N_minibatch_size) are timed one by one: the first call (including tracing) and the median and
+minimum of run.benchmark_repeats further calls (default 10, +run.benchmark_micro=False skips them). benchmark_suite.py runs this over a matrix of
+models, batch sizes, episode lengths and precisions.
+"""
+
+import datetime
+import importlib
+import json
+import os
+import time
+import tensorflow as tf
+import Compile
+import Parameters
+import Definitions
+import Graphs
+import State
+
+Equations = importlib.import_module(Parameters.MODEL_NAME + ".Equations")
+
+# benchmark_suite.py collects the records of its runs in a file of its own
+RESULTS_FILE = os.getenv("DEQN_BENCHMARK_RESULTS", os.path.join(os.getcwd(), "benchmark_results.jsonl"))
+
+def euler_errors(state_episode):
+    """ Mean absolute residual of each equilibrium condition over a simulated episode """
+    # an ensemble keeps its member axis, the constants of the members broadcast against it
+    states = state_episode if Parameters.ensemble else tf.reshape(state_episode, [-1, len(Parameters.states)])
+    with Definitions.evaluation_context():
+        losses = Equations.equations(states, Parameters.policy(states))
+    return {eq: float(tf.math.reduce_mean(tf.math.abs(val))) for eq, val in losses.items()}
+
+def sync(result):
+    """ Waits for a result by pulling one of its tensors to the host """
+    tensors = [t for t in tf.nest.flatten(result) if hasattr(t, "numpy")]
+    if tensors:
+        tensors[0].numpy()
+
+def time_kernel(fn, args, repeats):
+    start = time.perf_counter()
+    sync(fn(*args))
+    first_call = time.perf_counter() - start
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        sync(fn(*args))
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return {"first_call_seconds": first_call, "median_seconds": times[len(times) // 2], "min_seconds": times[0]}
+
+def micro_benchmarks(state_episode):
+    """ Times the hot paths one by one on the states of a simulated episode """
+    state_batch = state_episode[0]
+
+    def equations(state):
+        with Definitions.evaluation_context():
+            return Equations.equations(state, Parameters.policy(state))
+
+    def expectation(state):
+        # the cost of E_t_gen is the policy on all expectation nodes, the integrand is the next policy itself
+        with Definitions.evaluation_context():
+            return State.E_t_gen(state, Parameters.policy(state))(lambda next_state, next_policy: next_policy)
+
+    kernels = {
+        "policy": (Compile.function(Parameters.policy, name="benchmark_policy"), (state_batch,)),
+        "equations": (Compile.function(equations, name="benchmark_equations"), (state_batch,)),
+        "E_t_gen": (Compile.function(expectation, name="benchmark_E_t_gen"), (state_batch,)),
+        # the kernels themselves, not run_episode / run_epoch / run_cycle, which would record metrics, update the convergence
+        # monitor and the schedules and could grow the minibatch (and retrace) during the benchmark
+        "simulate_random_episode": (Graphs.simulate_random_episode, (state_episode[0], state_episode.shape[0])),
+        "run_epoch_compiled": (Graphs.run_epoch_compiled, (state_episode, Parameters.N_minibatch_size)),
+    }
+
+    results = {}
+    for name, (fn, args) in kernels.items():
+        # the training kernel needs the learning phase as in run_cycle
+        tf.keras.backend.set_learning_phase(1 if name == "run_epoch_compiled" else 0)
+        results[name] = time_kernel(fn, args, Parameters.benchmark_repeats)
+        tf.keras.backend.set_learning_phase(0)
+    return results
+
+def run_benchmark():
+    state_episode = tf.tile(tf.expand_dims(Parameters.starting_state, axis=0), [Parameters.N_episode_length] + [1] * len(Parameters.starting_state.shape))
+
+    # full training cycles (simulation, epochs and the bookkeeping of the episode), timed by the phase timers of Graphs
+    simulation_time = 0.0
+    training_time = 0.0
+    cycle_time = 0.0
+    samples = 0
+    Graphs.timers.reset()
+    for i in range(Parameters.N_episodes):
+        # the minibatch can grow from one episode to the next
+        n_batches = (Parameters.N_episode_length * Parameters.N_sim_batch) // Parameters.minibatch_growth.size()
+        samples += Parameters.N_epochs_per_episode * n_batches * Parameters.minibatch_growth.size()
+        state_episode = Graphs.run_cycle(state_episode)
+        seconds = Graphs.timers.end_episode()
+        simulation_time += seconds['simulation']
+        training_time += seconds['epochs']
+        cycle_time += seconds['total']
+
+        if Parameters.initialize_each_episode:
+            Parameters.starting_state.assign(Parameters.initialize_states())
+        else:
+            Parameters.starting_state.assign(state_episode[Parameters.N_episode_length-1])
+        state_episode = tf.tensor_scatter_nd_update(state_episode, tf.constant([[ 0 ]]), tf.expand_dims(Parameters.starting_state, axis=0))
+
+    # in data-parallel runs every worker trains on its own minibatches, every member of an ensemble on its own samples
+    samples *= Parameters.num_workers * Parameters.ensemble_size
+    record = {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "MODEL_NAME": Parameters.MODEL_NAME,
+        "keras_precision": Parameters.keras_precision,
+        "loss_scaling": Parameters.loss_scaling,
+        # XLA can be switched off by the fallback, so the effective mode is recorded
+        "xla_compile": Compile.xla_enabled,
+        "workers": Parameters.num_workers,
+        "N_sim_batch": Parameters.N_sim_batch,
+        "N_episode_length": Parameters.N_episode_length,
+        "N_minibatch_size": Parameters.N_minibatch_size,
+        # after the growth of the minibatch, if any
+        "N_minibatch_size_final": Parameters.minibatch_growth.size(),
+        "N_episodes": Parameters.N_episodes,
+        "seed": Parameters.seed,
+        # the first episode includes tracing
+        "simulation_seconds": simulation_time,
+        "training_seconds": training_time,
+        "cycle_seconds": cycle_time,
+        "samples_per_second": samples / training_time,
+        "traces": {name: report["traces"] for name, report in Compile.trace_report().items()},
+        "tracing_seconds": sum(report["seconds"] for report in Compile.trace_report().values()),
+        # per sample of the last epoch (over the members of an ensemble as well), as pulled by the convergence monitor
+        "final_MSE_no_penalty": Graphs.convergence.last_net_loss,
+        "euler_errors": euler_errors(Graphs.run_episode(state_episode)),
+    }
+    if Parameters.benchmark_micro:
+        record["micro"] = micro_benchmarks(state_episode)
+
+    if Parameters.horovod_worker:
+        return
+
+    with open(RESULTS_FILE, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+    print(json.dumps(record, indent=2))
+
+run_benchmark()
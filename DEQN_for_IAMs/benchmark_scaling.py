@@ -0,0 +1,43 @@
+"""
+Filename: benchmark_scaling.py
+Description:
+Scaling benchmark of the local data-parallel training (run_parallel.py). Runs benchmark.py with 1, 2, 4, 8 and 16
+workers (or the worker counts given with --workers) and prints the throughput, speedup and parallel efficiency
+relative to the first worker count. The individual records are appended to benchmark_results.jsonl.
+
+Usage:
+    python benchmark_scaling.py [--workers 1 2 4] [hydra overrides]
+"""
+
+import json
+import os
+import sys
+import run_parallel
+
+def main(args):
+    workers = [1, 2, 4, 8, 16]
+    if args and args[0] == "--workers":
+        args = args[1:]
+        workers = []
+        while args and args[0].isdigit():
+            workers.append(int(args.pop(0)))
+
+    results_file = os.path.join(os.getcwd(), "benchmark_results.jsonl")
+    n_records = sum(1 for _ in open(results_file)) if os.path.exists(results_file) else 0
+    for n in workers:
+        if run_parallel.launch(n, "benchmark.py", list(args)) != 0:
+            print("Benchmark with " + str(n) + " workers failed")
+            return 1
+
+    with open(results_file) as f:
+        records = [json.loads(line) for line in f][n_records:]
+
+    base = records[0]["samples_per_second"] / records[0]["workers"]
+    print("workers  samples/s  speedup  efficiency")
+    for r in records:
+        speedup = r["samples_per_second"] / base
+        print("{:7d}  {:9.1f}  {:7.2f}  {:10.2f}".format(r["workers"], r["samples_per_second"], speedup, speedup / r["workers"]))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
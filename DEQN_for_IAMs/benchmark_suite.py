@@ -0,0 +1,152 @@
+"""
+Filename: benchmark_suite.py
+Description:
+Runs benchmark.py over a matrix of model packages, simulation batch sizes, episode lengths and precisions and writes
+all records into one JSON file (benchmarks/<commit>.json by default), together with the commit and the matrix.
+Every case starts from a freshly initialized network with a fixed seed in a run directory of its own
+(benchmarks/runs/<case>), so the results only depend on the code and the configuration.
+The compare mode prints the ratio of the timings of two result files case by case and fails if a timing got slower
+than the threshold (default 10%), e.g. to measure an optimization against the commit before it.
+
+Usage:
+    python benchmark_suite.py [--models dice_generic gdice_baseline] [--batch-sizes 64 256] [--episode-lengths 32 128]
+                              [--precisions float32 bfloat16] [--episodes 5] [--repeats 10] [--output results.json] [hydra overrides]
+    python benchmark_suite.py --compare benchmarks/<old>.json benchmarks/<new>.json [--threshold 0.1]
+"""
+
+import datetime
+import itertools
+import json
+import os
+import subprocess
+import sys
+
+# configs of every model package
+MODELS = {
+    "dice_generic": ["MODEL_NAME=dice_generic", "constants=dice_generic_mmm_mmm", "variables=dice_generic_mmm_mmm", "run=dice_generic_1yts", "net=dice_generic", "optimizer=dice_generic"],
+    "dice_generic_FEX": ["MODEL_NAME=dice_generic_FEX", "constants=dice_generic_2016", "variables=dice_generic_2016_FEX", "run=dice_generic_1yts", "net=dice_generic", "optimizer=dice_generic"],
+    "gdice_baseline": ["MODEL_NAME=gdice_baseline", "constants=gdice_baseline_mmm_mmm", "variables=gdice_baseline_mmm_mmm", "run=gdice_baseline_1yts", "net=gdice_baseline", "optimizer=gdice_baseline"],
+}
+
+def commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def case_name(model, batch_size, episode_length, precision):
+    return model + "_b" + str(batch_size) + "_t" + str(episode_length) + "_" + precision
+
+def run_case(model, batch_size, episode_length, precision, episodes, repeats, overrides, results_file):
+    name = case_name(model, batch_size, episode_length, precision)
+    minibatch_size = min(128, batch_size * episode_length)
+    command = [sys.executable, "benchmark.py"] + MODELS[model] + [
+        "seed=42", "STARTING_POINT=NEW", "hydra.run.dir=" + os.path.join("benchmarks", "runs", name),
+        "run.N_sim_batch=" + str(batch_size), "run.N_episode_length=" + str(episode_length), "run.N_minibatch_size=" + str(minibatch_size),
+        "run.keras_precision=" + precision, "run.N_episodes=" + str(episodes), "+run.benchmark_repeats=" + str(repeats)] + overrides
+    print("Running " + name)
+    env = dict(os.environ)
+    env["DEQN_BENCHMARK_RESULTS"] = results_file
+    n_records = sum(1 for _ in open(results_file)) if os.path.exists(results_file) else 0
+    if subprocess.call(command, env=env) != 0:
+        print("Benchmark " + name + " failed")
+        return None
+    with open(results_file) as f:
+        records = [json.loads(line) for line in f][n_records:]
+    return records[-1] if records else None
+
+def run_suite(models, batch_sizes, episode_lengths, precisions, episodes, repeats, overrides, output):
+    output = output or os.path.join("benchmarks", commit() + ".json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    results_file = output + ".jsonl"
+    results = {}
+    for model, batch_size, episode_length, precision in itertools.product(models, batch_sizes, episode_lengths, precisions):
+        record = run_case(model, batch_size, episode_length, precision, episodes, repeats, overrides, results_file)
+        if record is not None:
+            results[case_name(model, batch_size, episode_length, precision)] = record
+
+    suite = {
+        "commit": commit(),
+        "timestamp": datetime.datetime.now().isoformat(),
+        "matrix": {"models": models, "batch_sizes": batch_sizes, "episode_lengths": episode_lengths, "precisions": precisions,
+                   "episodes": episodes, "repeats": repeats, "overrides": overrides},
+        "results": results,
+    }
+    with open(output, "w") as f:
+        json.dump(suite, f, indent=2)
+    print("Results of " + str(len(results)) + " cases written to " + output)
+    return 0 if len(results) == len(models) * len(batch_sizes) * len(episode_lengths) * len(precisions) else 1
+
+def timings(record):
+    """ Seconds of every timed path of a record (lower is better) """
+    result = {"simulation_seconds": record["simulation_seconds"], "training_seconds": record["training_seconds"]}
+    if "cycle_seconds" in record:
+        result["cycle_seconds"] = record["cycle_seconds"]
+    for name, micro in record.get("micro", {}).items():
+        result[name] = micro["median_seconds"]
+    return result
+
+def compare(old_file, new_file, threshold):
+    with open(old_file) as f:
+        old = json.load(f)
+    with open(new_file) as f:
+        new = json.load(f)
+    print("Comparing " + old.get("commit", old_file) + " (old) with " + new.get("commit", new_file) + " (new), ratio new/old")
+    regressions = []
+    for case in sorted(set(old["results"]) & set(new["results"])):
+        old_timings, new_timings = timings(old["results"][case]), timings(new["results"][case])
+        print(case)
+        for name in [n for n in new_timings if n in old_timings]:
+            ratio = new_timings[name] / old_timings[name] if old_timings[name] > 0 else float("inf")
+            flag = ""
+            if ratio > 1 + threshold:
+                flag = "  SLOWER"
+                regressions.append(case + " " + name)
+            elif ratio < 1 - threshold:
+                flag = "  faster"
+            print("  {:<20} {:10.4f}s {:10.4f}s {:7.2f}{}".format(name, old_timings[name], new_timings[name], ratio, flag))
+    for case in sorted(set(old["results"]) ^ set(new["results"])):
+        print(case + ": only in " + (old_file if case in old["results"] else new_file))
+    if regressions:
+        print(str(len(regressions)) + " timings slower by more than " + str(int(threshold * 100)) + "%")
+        return 1
+    return 0
+
+def main(args):
+    if args and args[0] == "--compare":
+        threshold = float(args[args.index("--threshold") + 1]) if "--threshold" in args else 0.1
+        return compare(args[1], args[2], threshold)
+
+    models, batch_sizes, episode_lengths, precisions = ["dice_generic"], [256], [64], ["float32"]
+    episodes, repeats, output, overrides = 5, 10, None, []
+    while args:
+        arg = args.pop(0)
+        values = []
+        while args and arg.startswith("--") and not args[0].startswith("--") and "=" not in args[0]:
+            values.append(args.pop(0))
+        if arg == "--models":
+            models = values
+        elif arg == "--batch-sizes":
+            batch_sizes = [int(v) for v in values]
+        elif arg == "--episode-lengths":
+            episode_lengths = [int(v) for v in values]
+        elif arg == "--precisions":
+            precisions = values
+        elif arg == "--episodes":
+            episodes = int(values[0])
+        elif arg == "--repeats":
+            repeats = int(values[0])
+        elif arg == "--output":
+            output = values[0]
+        else:
+            # hydra overrides passed to every case
+            overrides.append(arg)
+
+    unknown = [m for m in models if m not in MODELS]
+    if unknown:
+        print("Unknown models " + str(unknown) + ", available: " + ", ".join(MODELS))
+        return 1
+    return run_suite(models, batch_sizes, episode_lengths, precisions, episodes, repeats, overrides, output)
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
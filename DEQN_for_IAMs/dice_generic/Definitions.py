@@ -1,5 +1,4 @@
 import tensorflow as tf
-import numpy as np
 import Parameters
 import PolicyState
 import State
@@ -94,7 +93,7 @@ def gr_lab(state, policy_state):
 def sigma(state, policy_state):
     """ Carbon intensity """
     _t = tau2t(state, policy_state)
-    _sigma = sigma0 * tf.math.exp(Tstep * gSigma0 / np.log(1 + Tstep * deltaSigma)*
+    _sigma = sigma0 * tf.math.exp(Tstep * gSigma0 / tf.math.log(1 + Tstep * deltaSigma)*
                     ((1 + Tstep * deltaSigma)**_t - 1))
     return _sigma
 
@@ -119,7 +118,7 @@ def Eland(state, policy_state):
 def Fex(state, policy_state):
     """ External radiative forcing """
     _t = tau2t(state, policy_state)
-    Year = np.int(Tyears / Tstep)
+    Year = tf.math.floor(Tyears / Tstep)
     _Fex = fex0 + (1 / Year) * (fex1 - fex0) * tf.math.minimum(_t, Year)
     return _Fex
 
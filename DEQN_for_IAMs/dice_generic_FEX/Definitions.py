@@ -1,5 +1,4 @@
 import tensorflow as tf
-import numpy as np
 import Parameters
 import PolicyState
 import State
@@ -93,7 +92,7 @@ def gr_lab(state, policy_state):
 def sigma(state, policy_state):
     """ Carbon intensity """
     _t = tau2t(state, policy_state)
-    _sigma = sigma0 * tf.math.exp(Tstep * gSigma0 / np.log(1 + Tstep * deltaSigma)*
+    _sigma = sigma0 * tf.math.exp(Tstep * gSigma0 / tf.math.log(1 + Tstep * deltaSigma)*
                     ((1 + Tstep * deltaSigma)**_t - 1))
     return _sigma
 
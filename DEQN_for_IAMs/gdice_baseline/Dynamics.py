@@ -59,23 +59,14 @@ def shock_step_spec_shock(prev_state, shock_index):
 def policy_step(prev_state, policy_state):
     """ State variables are updated by the optimal policy (capital stock) or
     the laws of motion for carbon masses and temperatures """
-    _policy_step = tf.zeros_like(prev_state)  # Initialization
-
-    # Update state variables if needed
-    _policy_step = State.update(
-        _policy_step, 'kx', PolicyState.kplusy(policy_state))
-    _policy_step = State.update(
-        _policy_step, 'MATx', Definitions.MATplus(prev_state, policy_state))
-    _policy_step = State.update(
-        _policy_step, 'MUOx', Definitions.MUOplus(prev_state, policy_state))
-    _policy_step = State.update(
-        _policy_step, 'MLOx', Definitions.MLOplus(prev_state, policy_state))
-    _policy_step = State.update(
-        _policy_step, 'TATx', Definitions.TATplus(prev_state, policy_state))
-    _policy_step = State.update(
-        _policy_step, 'TOCx', Definitions.TOCplus(prev_state, policy_state))
-    _policy_step = State.update(
-        _policy_step, 'taux', Definitions.tau2tauplus(prev_state, policy_state)
-    )
+    _policy_step = State.stack({
+        'kx': PolicyState.kplusy(policy_state),
+        'MATx': Definitions.MATplus(prev_state, policy_state),
+        'MUOx': Definitions.MUOplus(prev_state, policy_state),
+        'MLOx': Definitions.MLOplus(prev_state, policy_state),
+        'TATx': Definitions.TATplus(prev_state, policy_state),
+        'TOCx': Definitions.TOCplus(prev_state, policy_state),
+        'taux': Definitions.tau2tauplus(prev_state, policy_state)
+    }, prev_state)
 
     return _policy_step
@@ -21,6 +21,7 @@ from matplotlib import rc
 import State
 import PolicyState
 import Definitions
+import Profiling
 from Graphs import run_episode
 
 tf.get_logger().setLevel('CRITICAL')
@@ -43,14 +44,14 @@ print("-" * terminal_size_col)
 print(r"Simulate the dynamics of the exogenous parameters")
 # --------------------------------------------------------------------------- #
 
-alpha = Parameters.alpha
+alpha = Parameters.constants.value("alpha")
 starting_state = Parameters.starting_state
 starting_policy = Parameters.policy(starting_state)
 
 Equations = importlib.import_module(Parameters.MODEL_NAME + ".Equations")
 
 # Extract parameters
-psi = Parameters.psi
+psi = Parameters.constants.value("psi")
 
 N_state = len(Parameters.states)  # Number of state variables
 N_policy_state = len(Parameters.policy_states)  # Number of policy variables
@@ -58,10 +59,8 @@ N_defined = len(Parameters.definitions)  # Number of defined variables
 
 # Simulate the economy for N_simulated episode length
 N_episode_length = Parameters.N_episode_length
-starting_state = tf.reshape(tf.constant([
-    Parameters.k0, Parameters.MAT0, Parameters.MUO0, Parameters.MLO0,
-    Parameters.TAT0, Parameters.TOC0,
-    Parameters.tau0]), shape=(1, N_state))
+starting_state = tf.reshape(tf.constant([Parameters.constants.value(c) for c in
+    ["k0", "MAT0", "MUO0", "MLO0", "TAT0", "TOC0", "tau0"]]), shape=(1, N_state))
 
 # Simulate the economy for N_episode_length time periods
 simulation_starting_state = tf.tile(tf.expand_dims(
@@ -287,5 +286,9 @@ euler_discrepancies_df.describe(percentiles=err_percentiles, include='all').to_c
     index=True, float_format='%.3e')
 
 
+# time of every startup phase and of the post-processing itself
+Profiling.startup.mark("post-processing")
+Profiling.startup.print_report()
+
 print("-" * terminal_size_col)
 print("Finished calculating Euler discrepancies and exit")
@@ -0,0 +1,69 @@
+"""
+Filename: run_parallel.py
+Description:
+Data-parallel training on a single multi-core machine without Horovod/MPI.
+Starts N worker processes of run_deepnet.py (or of the script given with --script) that train one network together
+with tf.distribute.MultiWorkerMirroredStrategy: every worker simulates its own episodes (seeded with seed + rank),
+the gradients of each minibatch are averaged over all workers and only the first worker writes checkpoints and logs.
+Each worker is pinned to its own share of the CPU cores.
+
+Usage:
+    python run_parallel.py 4 [--script run_deepnet.py] [hydra overrides]
+
+All workers share one hydra.run.dir, a timestamped one is added if it is not given.
+"""
+
+import datetime
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+def free_ports(n):
+    sockets = [socket.socket() for _ in range(n)]
+    for s in sockets:
+        s.bind(("localhost", 0))
+    ports = [s.getsockname()[1] for s in sockets]
+    for s in sockets:
+        s.close()
+    return ports
+
+def cpu_sets(n):
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count()))
+    per_worker = max(1, len(cpus) // n)
+    return [cpus[(rank * per_worker) % len(cpus):(rank * per_worker) % len(cpus) + per_worker] for rank in range(n)]
+
+def launch(n_workers, script, overrides):
+    if not any(o.startswith("hydra.run.dir=") for o in overrides):
+        overrides = overrides + ["hydra.run.dir=runs/parallel/" + datetime.datetime.now().strftime("%Y-%m-%d/%H-%M-%S")]
+
+    cluster = {"worker": ["localhost:" + str(port) for port in free_ports(n_workers)]}
+    processes = []
+    for rank, cpus in enumerate(cpu_sets(n_workers)):
+        env = dict(os.environ)
+        env["TF_CONFIG"] = json.dumps({"cluster": cluster, "task": {"type": "worker", "index": rank}})
+        env["DEQN_LOCAL_WORKERS"] = str(n_workers)
+        env["DEQN_THREADS_PER_WORKER"] = str(len(cpus))
+        pin = (lambda c: lambda: os.sched_setaffinity(0, c))(cpus) if hasattr(os, "sched_setaffinity") else None
+        processes.append(subprocess.Popen([sys.executable, script] + overrides, env=env, preexec_fn=pin))
+
+    # if one worker fails the others would wait forever in the all-reduce
+    while any(p.poll() is None for p in processes):
+        if any(p.poll() not in (None, 0) for p in processes):
+            for p in processes:
+                if p.poll() is None:
+                    p.terminate()
+        time.sleep(1)
+
+    return max(abs(p.returncode) for p in processes)
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    n_workers = int(args.pop(0))
+    script = "run_deepnet.py"
+    if args and args[0] == "--script":
+        script = args[1]
+        args = args[2:]
+    sys.exit(launch(n_workers, script, args))
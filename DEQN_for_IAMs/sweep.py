@@ -0,0 +1,187 @@
+"""
+Filename: sweep.py
+Description:
+Runs a grid of configurations (hydra overrides) of run_deepnet.py as a queue on a local process pool.
+Each job runs in its own run directory (runs/sweeps/<name>/<job>) and is pinned to its own share of the CPU cores.
+Interrupted or failed jobs are resumed from their latest checkpoint when the sweep is started again (or retried
+up to --retries times right away), finished jobs are skipped.
+The status, attempts, wall time and the final losses of all jobs are kept in runs/sweeps/<name>/index.json.
+
+Usage:
+    python sweep.py sweep.yaml [--jobs 4] [--retries 1] [--dry-run]
+
+Sweep file:
+    name: dice_generic_calibrations
+    script: run_deepnet.py            # optional
+    overrides:                        # passed to every job
+      - run=dice_generic_1yts
+      - +run.convergence_patience=500
+    grid:                             # every combination of the values is a job
+      constants,variables:            # several keys separated by commas take lists of values that go together
+        - [dice_generic_mmm_mmm, dice_generic_mmm_mmm]
+        - [dice_generic_mmm_giss, dice_generic_mmm_giss]
+      optimizer.learning_rate: [1e-5, 3e-6]
+"""
+
+import csv
+import itertools
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import time
+from omegaconf import OmegaConf
+import run_parallel
+
+def expand_grid(grid):
+    """ List of override lists, one per combination of the grid values """
+    axes = []
+    for keys, values in grid.items():
+        keys = [k.strip() for k in keys.split(",")]
+        axes.append([list(zip(keys, v if len(keys) > 1 else [v])) for v in values])
+    return [[k + "=" + str(v) for group in combination for k, v in group] for combination in itertools.product(*axes)]
+
+def job_name(overrides):
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", "__".join(o.split("=", 1)[1] for o in overrides)) or "default"
+
+def last_metrics(run_dir):
+    """ Last row of the metrics log and the convergence summary of a run """
+    result = {}
+    metrics_file = os.path.join(run_dir, "metrics.csv")
+    if os.path.exists(metrics_file):
+        with open(metrics_file, newline="") as f:
+            rows = list(csv.DictReader(f))
+        if rows:
+            result.update({k: float(v) for k, v in rows[-1].items()})
+    convergence_file = os.path.join(run_dir, "convergence.json")
+    if os.path.exists(convergence_file):
+        with open(convergence_file) as f:
+            convergence = json.load(f)
+        result["converged"] = convergence["converged"]
+        result["convergence_reason"] = convergence["reason"]
+    return result
+
+class Sweep:
+    def __init__(self, sweep_file, n_jobs, retries):
+        spec = OmegaConf.to_container(OmegaConf.load(sweep_file))
+        self.name = spec.get("name", os.path.splitext(os.path.basename(sweep_file))[0])
+        self.script = spec.get("script", "run_deepnet.py")
+        self.base_overrides = spec.get("overrides", [])
+        self.n_jobs = n_jobs
+        self.retries = retries
+        self.sweep_dir = os.path.join("runs", "sweeps", self.name)
+        self.index_file = os.path.join(self.sweep_dir, "index.json")
+
+        self.index = {}
+        if os.path.exists(self.index_file):
+            with open(self.index_file) as f:
+                self.index = json.load(f)
+
+        for overrides in expand_grid(spec.get("grid", {})):
+            name = job_name(overrides)
+            job = self.index.setdefault(name, {"overrides": overrides, "run_dir": os.path.join(self.sweep_dir, name), "status": "pending", "attempts": 0, "wall_seconds": 0.0})
+            # jobs that failed or were running when the sweep was interrupted are resumed
+            if job["status"] in ("running", "interrupted", "failed"):
+                job["status"] = "pending"
+        # attempts in this invocation, failed jobs are retried up to retries times
+        self.attempts = {}
+
+    def write_index(self):
+        os.makedirs(self.sweep_dir, exist_ok=True)
+        tmp_file = self.index_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(self.index, f, indent=2)
+        os.replace(tmp_file, self.index_file)
+
+    def start(self, name, cpus):
+        job = self.index[name]
+        os.makedirs(job["run_dir"], exist_ok=True)
+        env = dict(os.environ)
+        env["DEQN_THREADS_PER_WORKER"] = str(len(cpus))
+        pin = (lambda c: lambda: os.sched_setaffinity(0, c))(cpus) if hasattr(os, "sched_setaffinity") else None
+        # an interrupted job continues from its latest checkpoint, a new one finds an empty run directory
+        command = [sys.executable, self.script] + self.base_overrides + job["overrides"] + ["STARTING_POINT=LATEST", "hydra.run.dir=" + job["run_dir"]]
+        log = open(os.path.join(job["run_dir"], "sweep.log"), "a")
+        job["status"] = "running"
+        job["attempts"] += 1
+        self.attempts[name] = self.attempts.get(name, 0) + 1
+        print("Starting " + name + " (attempt " + str(job["attempts"]) + ")")
+        return subprocess.Popen(command, env=env, stdout=log, stderr=subprocess.STDOUT, preexec_fn=pin), log, time.time()
+
+    def finish(self, name, process, start_time):
+        job = self.index[name]
+        job["wall_seconds"] += time.time() - start_time
+        job["returncode"] = process.returncode
+        job["final"] = last_metrics(job["run_dir"])
+        if process.returncode == 0:
+            job["status"] = "done"
+        elif self.attempts[name] <= self.retries:
+            job["status"] = "pending"
+        else:
+            job["status"] = "failed"
+        print("Finished " + name + ": " + job["status"])
+
+    def run(self):
+        queue = [name for name, job in self.index.items() if job["status"] == "pending"]
+        free_slots = run_parallel.cpu_sets(self.n_jobs)
+        running = {}
+        self.write_index()
+
+        def stop(signum, frame):
+            # the jobs write their last checkpoint on SIGTERM
+            for name, (process, log, start_time, cpus) in running.items():
+                process.terminate()
+                process.wait()
+                self.finish(name, process, start_time)
+                self.index[name]["status"] = "interrupted"
+            self.write_index()
+            raise SystemExit(128 + signum)
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        while queue or running:
+            while queue and free_slots:
+                name = queue.pop(0)
+                cpus = free_slots.pop(0)
+                process, log, start_time = self.start(name, cpus)
+                running[name] = (process, log, start_time, cpus)
+                self.write_index()
+
+            for name, (process, log, start_time, cpus) in list(running.items()):
+                if process.poll() is not None:
+                    log.close()
+                    del running[name]
+                    free_slots.append(cpus)
+                    self.finish(name, process, start_time)
+                    if self.index[name]["status"] == "pending":
+                        queue.append(name)
+                    self.write_index()
+            time.sleep(1)
+
+        counts = {}
+        for job in self.index.values():
+            counts[job["status"]] = counts.get(job["status"], 0) + 1
+        print("Sweep " + self.name + ": " + ", ".join(str(n) + " " + status for status, n in counts.items()))
+        return 0 if counts.get("failed", 0) == 0 else 1
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    sweep_file = args.pop(0)
+    n_jobs, retries, dry_run = 1, 0, False
+    while args:
+        arg = args.pop(0)
+        if arg == "--jobs":
+            n_jobs = int(args.pop(0))
+        elif arg == "--retries":
+            retries = int(args.pop(0))
+        elif arg == "--dry-run":
+            dry_run = True
+
+    sweep = Sweep(sweep_file, n_jobs, retries)
+    if dry_run:
+        for name, job in sweep.index.items():
+            print(job["status"] + "  " + name + "  " + " ".join(job["overrides"]))
+        sys.exit(0)
+    sys.exit(sweep.run())
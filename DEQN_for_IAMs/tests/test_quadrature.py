@@ -0,0 +1,36 @@
+# Moments of standard normal shocks reproduced by the quadrature rules (run with python -m pytest tests from DEQN_for_IAMs)
+
+import os
+import sys
+import types
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("tensorflow")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def Quadrature(monkeypatch, tmp_path):
+    # Quadrature reads its settings from Parameters, which composes the hydra config on import
+    monkeypatch.setitem(sys.modules, "Parameters", types.SimpleNamespace(expectation_type='gauss_hermite', quadrature_level=3, quadrature_cache_dir=str(tmp_path)))
+    monkeypatch.delitem(sys.modules, "Quadrature", raising=False)
+    import Quadrature
+    return Quadrature
+
+@pytest.mark.parametrize("rule", ['gauss_hermite', 'smolyak'])
+@pytest.mark.parametrize("d", [1, 2])
+def test_normal_moments(Quadrature, rule, d):
+    nodes, weights = Quadrature.standard_nodes(rule, d, 3)
+    assert weights.sum() == pytest.approx(1.0)
+    for k in range(d):
+        assert np.dot(weights, nodes[:, k]) == pytest.approx(0.0, abs=1e-12)
+        assert np.dot(weights, nodes[:, k] ** 2) == pytest.approx(1.0)
+        assert np.dot(weights, nodes[:, k] ** 4) == pytest.approx(3.0)
+
+def test_aliases_share_the_cache(Quadrature, tmp_path):
+    product_nodes, product_weights = Quadrature.standard_nodes('product', 2, 3)
+    nodes, weights = Quadrature.standard_nodes('gauss_hermite', 2, 3)
+    assert os.listdir(tmp_path) == ["gauss_hermite_d2_l3.npz"]
+    np.testing.assert_allclose(product_nodes, nodes)
+    np.testing.assert_allclose(product_weights, weights)